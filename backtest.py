@@ -0,0 +1,235 @@
+import os
+import argparse
+import datetime as dt
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from price_cache import PricePanel
+from returns_context import ReturnsContext
+from portfolio_optimizer import PortfolioOptimizer
+from metrics_kernel import PortfolioMetrics, computeMetrics
+from instrumentation import span
+
+
+## Price panel shared by every window handled in a worker process
+_panel = None
+
+
+def initWorker(panel):
+    global _panel
+    _panel = panel
+
+
+@dataclass(frozen=True)
+class BacktestResult:
+    ## Out-of-sample daily returns of the strategy and the benchmark, the weights chosen at
+    ## each rebalance date, the one-way turnover they caused, the usual metrics and the
+    ## estimation window length in sessions
+    returns: pd.Series
+    benchmark: pd.Series
+    weights: pd.DataFrame
+    turnover: pd.Series
+    metrics: PortfolioMetrics
+    lookback: int
+
+
+def rebalancePositions(dates, frequency, first):
+    ## Row of the first trading day in each period, or every `frequency` rows for an integer
+    if isinstance(frequency, (int, np.integer)):
+        return np.arange(first, len(dates), frequency)
+    periods = dates.to_period(frequency)
+    starts = np.flatnonzero(np.r_[True, periods[1:] != periods[:-1]])
+    return starts[starts >= first]
+
+
+def solveWindows(task):
+    ## Weights for a run of consecutive rebalance dates. The first window is built from the
+    ## panel; every later one advances the previous optimizer, so its moments update with
+    ## the new rows only and each solve starts from the weights before it.
+    stocks, criterion, riskFreeRate, covarianceEstimator, slide, windows, panel = task
+    if panel is not None:
+        ## Shared pools are not initialized with this backtest's panel, so it comes with the task
+        initWorker(panel)
+    weights = []
+    optimizer = None
+    for start, end in windows:
+        if optimizer is not None:
+            try:
+                optimizer = optimizer.advance(end, slide=slide)
+            except ValueError:
+                ## A lookback shorter than the rebalance period leaves no rows to slide over
+                optimizer = None
+        if optimizer is None:
+            optimizer = PortfolioOptimizer(
+                stocks, start, end, criterion, riskFreeRate,
+                priceSource=_panel, covarianceEstimator=covarianceEstimator,
+            )
+        weights.append(optimizer.optimized_allocation["allocation"].to_numpy())
+    return weights
+
+
+def chunks(items, count):
+    ## `count` contiguous runs of nearly equal length
+    bounds = np.linspace(0, len(items), count + 1).astype(int)
+    return [items[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo]
+
+
+def heldReturns(assetReturns, positions, weights):
+    ## Daily returns of buy-and-hold segments, weights reset at every rebalance position.
+    ## Each asset's growth since its segment start comes from one cumulative log sum, so the
+    ## whole path is a handful of array operations whatever the number of rebalances.
+    logGrowth = np.cumsum(np.log1p(assetReturns), axis=0)
+    logGrowth = np.vstack([np.zeros(assetReturns.shape[1]), logGrowth])
+    lengths = np.diff(np.r_[positions, len(assetReturns)])
+    segment = np.repeat(np.arange(len(positions)), lengths)
+    rows = np.arange(positions[0], len(assetReturns))
+    base = np.repeat(logGrowth[positions], lengths, axis=0)
+    held = np.repeat(weights, lengths, axis=0)
+
+    value = np.einsum("ij,ij->i", held, np.exp(logGrowth[rows + 1] - base))
+    previous = np.r_[1.0, value[:-1]]
+    previous[np.r_[0, np.cumsum(lengths)[:-1]]] = 1.0
+    ## Weights that have drifted by the end of each segment, for turnover
+    ends = np.cumsum(lengths) - 1
+    drifted = held[ends] * np.exp(logGrowth[rows[ends] + 1] - base[ends])
+    drifted /= drifted.sum(axis=1, keepdims=True)
+    return value / previous - 1, segment, drifted
+
+
+## Shortest estimation window a derived lookback may shrink to, about two months of sessions
+MIN_LOOKBACK = 42
+
+
+class Backtester:
+    ## Walk-forward evaluation of one optimization criterion. At each rebalance date the
+    ## criterion is solved on the preceding `lookback` sessions (rolling) or on everything
+    ## before it (expanding), and the weights are held until the next rebalance. Without a
+    ## lookback, half the sessions in the range are used, up to a year.
+
+    def __init__(
+        self, stocks, start, end, optimization_criterion, riskFreeRate=0.07024, lookback=None,
+        rebalance="M", window="rolling", priceSource=None, covarianceEstimator="Sample", cost=0.0):
+        if window not in ("rolling", "expanding"):
+            raise ValueError(f"Unknown window type: {window}")
+        self.stocks = stocks
+        self.start = start
+        self.end = end
+        self.optimization_criterion = optimization_criterion
+        self.riskFreeRate = riskFreeRate
+        self.lookback = lookback
+        self.rebalance = rebalance
+        self.window = window
+        self.covarianceEstimator = covarianceEstimator
+        self.cost = cost
+        tickers = [stock + ".NS" for stock in stocks] + ["^NSEI"]
+        self.panel = PricePanel.load(tickers, start, end, priceSource)
+
+        prices = self.panel.prices
+        self.context = ReturnsContext(
+            prices[tickers[:-1]].pct_change(), prices["^NSEI"].pct_change().dropna()
+        )
+        if lookback is None:
+            self.lookback = lookback = min(252, len(self.context.dates) // 2)
+            if lookback < MIN_LOOKBACK:
+                raise ValueError("Not enough data for the lookback window and rebalance frequency!")
+        self.positions = rebalancePositions(self.context.dates, rebalance, lookback)
+        if len(self.positions) == 0:
+            raise ValueError("Not enough data for the lookback window and rebalance frequency!")
+
+    def windows(self):
+        ## Price-date bounds [start, end) of each estimation window; returns start the day
+        ## after `start` and the last one is the session before the rebalance
+        dates = self.context.dates
+        priceDates = self.panel.prices.index
+        first = priceDates.searchsorted(dates[0]) - 1
+        bounds = []
+        for position in self.positions:
+            if self.window == "rolling":
+                start = dates[position - self.lookback - 1] if position > self.lookback else priceDates[max(first, 0)]
+            else:
+                start = priceDates[max(first, 0)]
+            bounds.append((start.date(), dates[position].date()))
+        return bounds
+
+    def solve(self, workers=None, executor=None):
+        ## `executor` is a long-lived pool shared between backtests (the dashboard's), with
+        ## `workers` processes; otherwise a pool of `workers` is started for this run
+        windows = self.windows()
+        workers = workers or os.cpu_count()
+        workers = max(1, min(workers, len(windows)))
+        slide = self.window == "rolling"
+        panel = self.panel if executor is not None else None
+        tasks = [
+            (self.stocks, self.optimization_criterion, self.riskFreeRate, self.covarianceEstimator, slide, run, panel)
+            for run in chunks(windows, workers)
+        ]
+        with span("backtest.solve", windows=len(windows), workers=workers):
+            if executor is not None:
+                results = list(executor.map(solveWindows, tasks))
+            elif workers == 1:
+                initWorker(self.panel)
+                results = [solveWindows(task) for task in tasks]
+            else:
+                with ProcessPoolExecutor(max_workers=workers, initializer=initWorker, initargs=(self.panel,)) as executor:
+                    results = list(executor.map(solveWindows, tasks))
+        return np.array([weights for run in results for weights in run])
+
+    def run(self, workers=None, executor=None):
+        weights = self.solve(workers, executor)
+        context = self.context
+        returns, segment, drifted = heldReturns(context.assetReturns, self.positions, weights)
+
+        ## Turnover against the drifted holdings; the first rebalance buys from cash
+        turnover = np.r_[1.0, 0.5 * np.abs(weights[1:] - drifted[:-1]).sum(axis=1)]
+        starts = np.r_[0, np.flatnonzero(np.diff(segment)) + 1]
+        returns[starts] -= self.cost * turnover
+
+        dates = context.dates[self.positions[0]:]
+        benchmark = context.benchmarkReturns[self.positions[0]:]
+        tickers = [ticker.replace(".NS", "") for ticker in context.tickers]
+        rebalanceDates = context.dates[self.positions]
+        return BacktestResult(
+            returns=pd.Series(returns, index=dates, name="Portfolio"),
+            benchmark=pd.Series(benchmark, index=dates, name="^NSEI"),
+            weights=pd.DataFrame(weights, index=rebalanceDates, columns=tickers),
+            turnover=pd.Series(turnover, index=rebalanceDates, name="Turnover"),
+            metrics=computeMetrics(returns, benchmark, self.riskFreeRate),
+            lookback=self.lookback,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Walk-forward backtest of one optimization criterion")
+    parser.add_argument("tickers", nargs="+")
+    parser.add_argument("--start", required=True)
+    parser.add_argument("--end", default=dt.date.today().isoformat())
+    parser.add_argument("--criterion", default="Maximize Sharpe Ratio")
+    parser.add_argument("--risk-free-rate", type=float, default=0.07024)
+    parser.add_argument("--lookback", type=int, default=None, help="estimation window in sessions (default: half the range, up to 252)")
+    parser.add_argument("--rebalance", default="M", help="pandas period (W, M, Q) or a number of sessions")
+    parser.add_argument("--window", choices=["rolling", "expanding"], default="rolling")
+    parser.add_argument("--covariance", default="Sample")
+    parser.add_argument("--cost", type=float, default=0.0, help="cost per unit of one-way turnover")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--out", help="write daily returns and weights to this CSV prefix")
+    args = parser.parse_args()
+
+    rebalance = int(args.rebalance) if args.rebalance.isdigit() else args.rebalance
+    started = dt.datetime.now()
+    result = Backtester(
+        args.tickers, args.start, args.end, args.criterion, args.risk_free_rate, args.lookback,
+        rebalance, args.window, covarianceEstimator=args.covariance, cost=args.cost,
+    ).run(args.workers)
+    elapsed = (dt.datetime.now() - started).total_seconds()
+
+    for name, value in result.metrics.toDict().items():
+        print(f"{name:<20} {value:12.4f}")
+    print(f"{len(result.weights)} rebalances over {len(result.returns)} sessions in {elapsed:.1f}s")
+    if args.out:
+        pd.DataFrame({"Portfolio": result.returns, "Benchmark": result.benchmark}).to_csv(f"{args.out}_returns.csv")
+        result.weights.to_csv(f"{args.out}_weights.csv")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import os
+import json
+import argparse
+import datetime as dt
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from price_cache import PricePanel, defaultPriceCache
+from universe_panel import UniversePanel
+from portfolio_optimizer import PortfolioOptimizer
+
+
+## Price panel shared by every portfolio handled in a worker process
+_panel = None
+
+
+def initWorker(panel):
+    global _panel
+    _panel = panel
+
+
+def readPortfolios(path):
+    ## JSON list, JSON lines, or CSV with columns id, tickers, start, end, criterion, riskFreeRate
+    ## and optionally covariance (one of covariance.ESTIMATORS)
+    if path.endswith(".csv"):
+        frame = pd.read_csv(path)
+        portfolios = frame.to_dict("records")
+        for portfolio in portfolios:
+            portfolio["tickers"] = portfolio["tickers"].replace("|", " ").replace(",", " ").split()
+    elif path.endswith(".jsonl"):
+        with open(path) as f:
+            portfolios = [json.loads(line) for line in f if line.strip()]
+    else:
+        with open(path) as f:
+            portfolios = json.load(f)
+
+    for i, portfolio in enumerate(portfolios):
+        portfolio.setdefault("id", str(i))
+        portfolio["id"] = str(portfolio["id"])
+        portfolio["start"] = pd.Timestamp(portfolio["start"]).date()
+        portfolio["end"] = pd.Timestamp(portfolio["end"]).date()
+        portfolio.setdefault("criterion", "Maximize Sharpe Ratio")
+        portfolio.setdefault("riskFreeRate", 0.07024)
+        portfolio.setdefault("covariance", "Sample")
+    return portfolios
+
+
+def optimizePortfolio(portfolio, frontierPoints=100):
+    try:
+        optimizer = PortfolioOptimizer(
+            portfolio["tickers"],
+            portfolio["start"],
+            portfolio["end"],
+            portfolio["criterion"],
+            float(portfolio["riskFreeRate"]),
+            priceSource=_panel,
+            covarianceEstimator=portfolio["covariance"],
+        )
+        weights = optimizer.optimized_allocation["allocation"].to_numpy()
+        efficientList, targetReturns, efficientWeights = optimizer.frontierResults(frontierPoints)
+    except Exception as e:
+        return {"id": portfolio["id"], "error": str(e)}
+
+    return {
+        "id": portfolio["id"],
+        "error": None,
+        "weights": [
+            {"id": portfolio["id"], "ticker": ticker.replace(".NS", ""), "weight": weight}
+            for ticker, weight in zip(optimizer.context.tickers, weights)
+        ],
+        "frontier": [
+            {"id": portfolio["id"], "point": i, "return": ret, "volatility": std}
+            for i, (ret, std) in enumerate(zip(targetReturns, efficientList))
+        ],
+        "metrics": dict(id=portfolio["id"], criterion=portfolio["criterion"], **optimizer.portfolioStats(weights)),
+    }
+
+
+def loadPanel(portfolios, priceSource=None):
+    ## One fetch for the union of every ticker and date range in the batch
+    tickers = sorted({ticker + ".NS" for p in portfolios for ticker in p["tickers"]}) + ["^NSEI"]
+    start = min(p["start"] for p in portfolios)
+    end = max(p["end"] for p in portfolios)
+    if isinstance(priceSource, UniversePanel):
+        ## The universe is shared through the page cache and pickles as its path, so only
+        ## tickers outside it are fetched into an in-memory panel
+        missing = [ticker for ticker in tickers if ticker not in priceSource.columns]
+        fallback = None
+        if missing and priceSource.fallback is not None:
+            fallback = PricePanel.load(missing, start, end, priceSource.fallback)
+        return UniversePanel(priceSource.directory, fallback)
+    return PricePanel.load(tickers, start, end, priceSource)
+
+
+def runBatch(portfolios, workers=None, frontierPoints=100, priceSource=None):
+    panel = loadPanel(portfolios, priceSource)
+    if workers == 1:
+        initWorker(panel)
+        return [optimizePortfolio(p, frontierPoints) for p in portfolios]
+
+    workers = workers or os.cpu_count()
+    chunksize = max(1, len(portfolios) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=initWorker, initargs=(panel,)) as executor:
+        return list(
+            executor.map(optimizePortfolio, portfolios, [frontierPoints] * len(portfolios), chunksize=chunksize)
+        )
+
+
+def writeResults(results, outDir, format="parquet"):
+    os.makedirs(outDir, exist_ok=True)
+    tables = {
+        "weights": pd.DataFrame([row for r in results if not r["error"] for row in r["weights"]]),
+        "frontier": pd.DataFrame([row for r in results if not r["error"] for row in r["frontier"]]),
+        "metrics": pd.DataFrame([r["metrics"] for r in results if not r["error"]]),
+        "errors": pd.DataFrame(
+            [{"id": r["id"], "error": r["error"]} for r in results if r["error"]], columns=["id", "error"]
+        ),
+    }
+    for name, table in tables.items():
+        if format == "json":
+            table.to_json(os.path.join(outDir, f"{name}.json"), orient="records", indent=2)
+        else:
+            table.to_parquet(os.path.join(outDir, f"{name}.parquet"), index=False)
+    return tables
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Optimize a file of portfolios without the dashboard")
+    parser.add_argument("portfolios", help="JSON, JSON lines or CSV file of portfolio definitions")
+    parser.add_argument("--out", default="batch_results", help="output directory")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--format", choices=["parquet", "json"], default="parquet")
+    parser.add_argument("--frontier-points", type=int, default=100)
+    parser.add_argument("--universe", help="memory-mapped universe panel directory (see universe_panel.py)")
+    args = parser.parse_args()
+
+    portfolios = readPortfolios(args.portfolios)
+    started = dt.datetime.now()
+    priceSource = UniversePanel(args.universe, fallback=defaultPriceCache()) if args.universe else defaultPriceCache()
+    results = runBatch(portfolios, args.workers, args.frontier_points, priceSource)
+    tables = writeResults(results, args.out, args.format)
+    elapsed = (dt.datetime.now() - started).total_seconds()
+    print(
+        f"Optimized {len(tables['metrics'])} of {len(portfolios)} portfolios "
+        f"in {elapsed:.1f}s, {len(tables['errors'])} failed. Results in {args.out}/"
+    )
+
+
+if __name__ == "__main__":
+    main()
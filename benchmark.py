@@ -0,0 +1,169 @@
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import datetime as dt
+import numpy as np
+import pandas as pd
+import scipy
+from synthetic import SyntheticPriceSource
+from portfolio_optimizer import PortfolioOptimizer, OPTIMIZATION_CRITERIA
+from metrics import MetricsCalculator
+from risk import RiskMetrics
+
+
+def timeit(function, repeat):
+    ## Best of `repeat` runs, the usual way to keep scheduler noise out of comparisons
+    best = np.inf
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def benchmarkCase(numTickers, years, repeat, priceSource, end=dt.date(2025, 1, 1)):
+    tickers = [f"SYN{i:03d}" for i in range(numTickers)]
+    start = end - dt.timedelta(days=int(365.25 * years))
+    timings = {}
+
+    started = time.perf_counter()
+    optimizer = PortfolioOptimizer(tickers, start, end, "Minimize Volatility", priceSource=priceSource)
+    timings["setup"] = time.perf_counter() - started
+
+    def solveCold(criterion):
+        ## Maximize Sharpe reads its tangency off the frontier engine, so every repeat rebuilds it
+        optimizer.__dict__.pop("frontierEngine", None)
+        optimizer.__dict__.pop("frontier", None)
+        optimizer.optimization_function(criterion=criterion)
+
+    for criterion in OPTIMIZATION_CRITERIA:
+        timings[criterion] = timeit(lambda: solveCold(criterion), repeat)
+
+    def frontier():
+        optimizer.__dict__.pop("frontierEngine", None)
+        optimizer.frontierResults()
+
+    def simulations():
+        optimizer.__dict__.pop("simulationResults", None)
+        optimizer.simulations()
+
+    timings["frontier"] = timeit(frontier, repeat)
+    timings["simulations"] = timeit(simulations, repeat)
+    timings["metricDf"] = timeit(lambda: MetricsCalculator(optimizer).metricDf(), repeat)
+    timings["riskTable"] = timeit(lambda: RiskMetrics(optimizer).riskTable(), repeat)
+
+    return [
+        {"case": case, "tickers": numTickers, "years": years, "observations": len(optimizer.context.dates), "seconds": seconds}
+        for case, seconds in timings.items()
+    ]
+
+
+def coldStart(module, runs=5, top=10):
+    ## Import `module` in fresh interpreters, the cost a new dashboard process pays before
+    ## it can render. Reports the median wall time and the slowest modules by cumulative
+    ## import time from the last run's -X importtime trace.
+    seconds = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        trace = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True, text=True, check=True,
+        ).stderr
+        seconds.append(time.perf_counter() - started)
+
+    modules = {}
+    for line in trace.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        if "." not in name:
+            modules[name] = int(cumulative) / 1e6
+    slowest = sorted(modules.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        "module": module,
+        "runs": runs,
+        "seconds": float(np.median(seconds)),
+        "slowestImports": [{"module": name, "seconds": s} for name, s in slowest],
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": dt.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+    }
+
+
+def compare(results, baseline, threshold):
+    ## Cases slower than the baseline by more than `threshold` times are regressions
+    previous = {(r["case"], r["tickers"], r["years"]): r["seconds"] for r in baseline["results"]}
+    regressions = []
+    for r in results:
+        before = previous.get((r["case"], r["tickers"], r["years"]))
+        if before and r["seconds"] > before * threshold:
+            regressions.append({**r, "baseline": before, "ratio": r["seconds"] / before})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the optimizer on synthetic returns, no network needed")
+    parser.add_argument("--tickers", type=int, nargs="+", default=[5, 50, 500])
+    parser.add_argument("--years", type=float, nargs="+", default=[1, 5, 20])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="benchmark_results.json")
+    parser.add_argument("--compare", help="earlier results file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=1.25)
+    parser.add_argument("--cold-start", type=int, default=0, metavar="RUNS",
+                        help="also time a fresh `import main` over this many runs")
+    args = parser.parse_args()
+
+    priceSource = SyntheticPriceSource(seed=args.seed)
+    results = []
+    for numTickers in args.tickers:
+        for years in args.years:
+            rows = benchmarkCase(numTickers, years, args.repeat, priceSource)
+            for row in rows:
+                print(f"{row['tickers']:>4} tickers {row['years']:>4g}y  {row['case']:<36} {row['seconds'] * 1000:10.1f} ms")
+            results.extend(rows)
+
+    output = {"environment": environment(), "results": results}
+    if args.cold_start:
+        output["coldStart"] = coldStart("main", args.cold_start)
+        print(f"cold start (import main)  {output['coldStart']['seconds'] * 1000:10.1f} ms")
+        for row in output["coldStart"]["slowestImports"]:
+            print(f"    {row['module']:<30} {row['seconds'] * 1000:10.1f} ms")
+        results.append(
+            {"case": "coldStart", "tickers": 0, "years": 0, "observations": 0, "seconds": output["coldStart"]["seconds"]}
+        )
+
+    with open(args.out, "w") as f:
+        json.dump(output, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for r in regressions:
+            print(f"REGRESSION {r['case']} ({r['tickers']} tickers, {r['years']:g}y): {r['baseline'] * 1000:.1f} ms -> {r['seconds'] * 1000:.1f} ms ({r['ratio']:.2f}x)")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import numpy as np
+from criteria import COVARIANCE_ESTIMATORS
+
+
+class DenseCovariance:
+    ## A full n x n covariance matrix behind the same interface as FactorCovariance
+
+    def __init__(self, matrix):
+        self.matrix = np.asarray(matrix, dtype=np.float64)
+
+    def dot(self, weights):
+        return self.matrix @ weights
+
+    def variance(self, weights):
+        return weights @ self.matrix @ weights
+
+    def variances(self, weights):
+        ## Variance of every row of a block of portfolios
+        return np.einsum("ij,ij->i", weights @ self.matrix, weights)
+
+    def dense(self):
+        return self.matrix
+
+
+class FactorCovariance:
+    ## Covariance of a k-factor model, B B' + diag(d), kept as its n x k loadings and n
+    ## specific variances. Products with a weight vector go through the k factors, so a
+    ## portfolio variance costs O(nk) instead of O(n^2).
+
+    def __init__(self, loadings, specific):
+        self.loadings = np.asarray(loadings, dtype=np.float64)
+        self.specific = np.asarray(specific, dtype=np.float64)
+
+    def dot(self, weights):
+        return self.loadings @ (self.loadings.T @ weights) + self.specific * weights
+
+    def variance(self, weights):
+        exposure = self.loadings.T @ weights
+        return exposure @ exposure + self.specific @ weights**2
+
+    def variances(self, weights):
+        exposure = weights @ self.loadings
+        return np.einsum("ij,ij->i", exposure, exposure) + weights**2 @ self.specific
+
+    def dense(self):
+        return self.loadings @ self.loadings.T + np.diag(self.specific)
+
+
+def sampleCovariance(assetReturns):
+    return DenseCovariance(np.cov(assetReturns, rowvar=False))
+
+
+def ledoitWolf(assetReturns):
+    ## Shrinks the sample covariance towards a scaled identity with the intensity from
+    ## Ledoit & Wolf (2004), which stays well conditioned when tickers outnumber days.
+    ## Uses the 1/T normalisation of the paper.
+    X = assetReturns - assetReturns.mean(axis=0)
+    T, n = X.shape
+    sample = X.T @ X / T
+    target = np.trace(sample) / n
+    distance = np.sum(sample**2) - n * target**2
+    rowNorms = np.einsum("ij,ij->i", X, X)
+    spread = (rowNorms @ rowNorms / T - np.sum(sample**2)) / T
+    shrinkage = 0.0 if distance <= 0 else min(spread, distance) / distance
+    shrunk = (1 - shrinkage) * sample
+    shrunk[np.diag_indices(n)] += shrinkage * target
+    return DenseCovariance(shrunk)
+
+
+def ewmaCovariance(assetReturns, decay=0.94):
+    ## Exponentially weighted covariance, the most recent day weighted highest (RiskMetrics)
+    X = assetReturns - assetReturns.mean(axis=0)
+    weights = decay ** np.arange(len(X) - 1, -1, -1)
+    weights /= weights.sum()
+    return DenseCovariance((X * weights[:, None]).T @ X)
+
+
+def pcaFactorModel(assetReturns, numFactors=5):
+    ## Statistical factor model from the leading principal components of the returns. The
+    ## specific variances make the diagonal match the sample variances exactly.
+    X = assetReturns - assetReturns.mean(axis=0)
+    T, n = X.shape
+    numFactors = max(1, min(numFactors, n - 1, T - 1))
+    _, singular, components = np.linalg.svd(X, full_matrices=False)
+    loadings = components[:numFactors].T * (singular[:numFactors] / np.sqrt(T - 1))
+    total = np.einsum("ij,ij->j", X, X) / (T - 1)
+    specific = np.maximum(total - np.einsum("ij,ij->i", loadings, loadings), 1e-12 * total.max())
+    return FactorCovariance(loadings, specific)
+
+
+ESTIMATORS = dict(zip(COVARIANCE_ESTIMATORS, [sampleCovariance, ledoitWolf, ewmaCovariance, pcaFactorModel]))
+
+
+def estimateCovariance(assetReturns, estimator="Sample"):
+    if estimator not in ESTIMATORS:
+        raise ValueError(f"Unknown covariance estimator: {estimator}")
+    return ESTIMATORS[estimator](np.asarray(assetReturns, dtype=np.float64))
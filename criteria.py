@@ -0,0 +1,15 @@
+OPTIMIZATION_CRITERIA = [
+    "Maximize Sharpe Ratio",
+    "Minimize Volatility",
+    "Maximize Sortino Ratio",
+    "Minimize Tracking Error",
+    "Maximize Information Ratio",
+    "Minimize Conditional Value-at-Risk",
+]
+
+COVARIANCE_ESTIMATORS = [
+    "Sample",
+    "Ledoit-Wolf",
+    "EWMA",
+    "PCA Factor Model",
+]
@@ -0,0 +1,77 @@
+import numpy as np
+import scipy.optimize as sc
+import scipy.sparse as sp
+
+
+class CVaROptimizer:
+    ## Historical CVaR as a linear program (Rockafellar and Uryasev, 2000):
+    ##   minimize  zeta + 1 / ((1 - alpha) T) * sum(u)
+    ##   subject   u_t >= -r_t . w - zeta,  u_t >= 0,  sum(w) = 1,  bounds on w
+    ## The variables are stacked as [w (n), zeta (1), u (T)] and the constraint matrix is
+    ## assembled once in sparse form, so frontier points only change the right-hand side.
+
+    def __init__(self, assetReturns, alpha=0.95, constraintSet=(0, 1)):
+        self.assetReturns = np.asarray(assetReturns, dtype=np.float64)
+        self.alpha = alpha
+        scenarios, numAssets = self.assetReturns.shape
+        self.numAssets = numAssets
+        self.meanReturns = self.assetReturns.mean(axis=0)
+
+        self.c = np.concatenate(
+            [np.zeros(numAssets), [1.0], np.full(scenarios, 1.0 / ((1 - alpha) * scenarios))]
+        )
+        self.A_ub = sp.hstack(
+            [
+                sp.csr_matrix(-self.assetReturns),
+                sp.csr_matrix(-np.ones((scenarios, 1))),
+                -sp.identity(scenarios, format="csr"),
+            ],
+            format="csr",
+        )
+        self.b_ub = np.zeros(scenarios)
+        self.A_eq = sp.csr_matrix(
+            np.concatenate([np.ones(numAssets), np.zeros(1 + scenarios)])[None, :]
+        )
+        self.b_eq = np.array([1.0])
+        self.bounds = [tuple(constraintSet)] * numAssets + [(None, None)] + [(0, None)] * scenarios
+
+        ## Same system with a minimum-return row appended, used when tracing the frontier
+        returnRow = sp.csr_matrix(
+            np.concatenate([-self.meanReturns, np.zeros(1 + scenarios)])[None, :]
+        )
+        self.A_ubTarget = sp.vstack([self.A_ub, returnRow], format="csr")
+
+    def solve(self, targetReturn=None):
+        if targetReturn is None:
+            A_ub, b_ub = self.A_ub, self.b_ub
+        else:
+            A_ub, b_ub = self.A_ubTarget, np.append(self.b_ub, -targetReturn)
+
+        result = sc.linprog(
+            self.c,
+            A_ub=A_ub,
+            b_ub=b_ub,
+            A_eq=self.A_eq,
+            b_eq=self.b_eq,
+            bounds=self.bounds,
+            method="highs",
+        )
+        if not result.success:
+            raise ValueError(f"CVaR optimization failed: {result.message}")
+
+        weights = result.x[: self.numAssets]
+        return sc.OptimizeResult(
+            x=weights,
+            fun=result.fun,
+            var=result.x[self.numAssets],
+            success=result.success,
+            status=result.status,
+            message=result.message,
+            nit=result.nit,
+        )
+
+    def frontier(self, targetReturns):
+        solves = [self.solve(target) for target in targetReturns]
+        weights = np.array([solve["x"] for solve in solves])
+        cvar = np.array([solve["fun"] for solve in solves])
+        return weights, cvar
@@ -0,0 +1,236 @@
+import numpy as np
+
+
+class FrontierEngine:
+    ## Markowitz critical line algorithm for the long-only, fully invested mean-variance problem.
+    ## The frontier is piecewise linear in the weights between turning points, so once the
+    ## turning points are known any number of frontier portfolios costs one interpolation.
+
+    def __init__(self, meanReturns, covMatrix, constraintSet=(0, 1), tolerance=1e-10):
+        self.meanReturns = np.asarray(meanReturns, dtype=np.float64)
+        self.covMatrix = np.asarray(covMatrix, dtype=np.float64)
+        numAssets = len(self.meanReturns)
+        self.lowerBounds = np.full(numAssets, float(constraintSet[0]))
+        self.upperBounds = np.full(numAssets, float(constraintSet[1]))
+        self.tolerance = tolerance
+
+        ## The upper branch runs from the maximum return portfolio down to minimum variance.
+        ## Running the same algorithm on -mean traces the lower branch of the parabola.
+        upper = self.turningPoints(self.meanReturns)
+        lower = self.turningPoints(-self.meanReturns)
+        weights = np.vstack([lower, upper[::-1]])
+        returns = weights @ self.meanReturns
+
+        ## Corners with the same return (equal means, or the meeting point of the two branches)
+        ## collapse into the one with the lowest variance, which is the frontier portfolio there
+        variances = np.einsum("ij,jk,ik->i", weights, self.covMatrix, weights)
+        keep = [0]
+        for i in range(1, len(returns)):
+            if returns[i] > returns[keep[-1]] + self.tolerance:
+                keep.append(i)
+            elif variances[i] < variances[keep[-1]]:
+                keep[-1] = i
+        self.cornerWeights = weights[keep]
+        self.cornerReturns = returns[keep]
+
+    @property
+    def nbytes(self):
+        return self.covMatrix.nbytes + self.cornerWeights.nbytes + self.cornerReturns.nbytes
+
+    def matrices(self, meanReturns, free, weights):
+        bounded = [i for i in range(len(meanReturns)) if i not in free]
+        covF = self.covMatrix[np.ix_(free, free)]
+        meanF = meanReturns[free]
+        if not bounded:
+            return covF, None, meanF, None
+        covFB = self.covMatrix[np.ix_(free, bounded)]
+        return covF, covFB, meanF, weights[bounded]
+
+    def lambdasIn(self, covFInv, covFB, meanF, wB, lower, upper):
+        ## Lambda at which each free weight would hit a bound, for every free asset at once
+        onesF = np.ones(len(meanF))
+        c4 = covFInv @ onesF
+        c2 = covFInv @ meanF
+        c1 = onesF @ c4
+        c3 = onesF @ c2
+        c = -c1 * c2 + c3 * c4
+        bi = np.where(c > 0, upper, lower)
+        if wB is None:
+            numerator = c4 - c1 * bi
+        else:
+            l3 = covFInv @ (covFB @ wB)
+            numerator = (1 - wB.sum() + onesF @ l3) * c4 - c1 * (bi + l3)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            lam = numerator / c
+        lam[c == 0] = np.nan
+        return lam, bi
+
+    def lambdasOut(self, meanReturns, free, bounded, covFInv, weights):
+        ## Lambda at which each bounded weight would become free. Adding asset i to the free
+        ## set is a rank-one border of covF, so its inverse follows from the Schur complement
+        ## s = d - b' A^-1 b instead of a fresh inversion per candidate.
+        covFB = self.covMatrix[np.ix_(free, bounded)]
+        covBB = self.covMatrix[np.ix_(bounded, bounded)]
+        meanF, meanB = meanReturns[free], meanReturns[bounded]
+        wB = weights[bounded]
+        onesF = np.ones(len(free))
+
+        u = covFInv @ onesF
+        v = covFInv @ meanF
+        a = covFInv @ covFB
+        s = np.diag(covBB) - np.einsum("fb,fb->b", covFB, a)
+        oneA = onesF @ a
+        meanA = meanF @ a
+
+        c4 = (1 - oneA) / s
+        c2 = (meanB - meanA) / s
+        c1 = onesF @ u + (1 - oneA) ** 2 / s
+        c3 = onesF @ v + (1 - oneA) * (meanB - meanA) / s
+        c = -c1 * c2 + c3 * c4
+
+        ## Contribution of the assets that stay bounded (B without i)
+        z = covFB @ wB
+        yI = covBB @ wB - np.diag(covBB) * wB
+        aY = z @ a - np.einsum("fb,fb->b", a, covFB) * wB
+        uY = u @ z - (u @ covFB) * wB
+        l3 = (yI - aY) / s
+        l2 = uY + (1 - oneA) * l3
+        l1 = wB.sum() - wB
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            lam = ((1 - l1 + l2) * c4 - c1 * (wB + l3)) / c
+        lam[c == 0] = np.nan
+        return lam
+
+    def computeWeights(self, covFInv, covFB, meanF, wB, lam):
+        onesF = np.ones(len(meanF))
+        g1 = onesF @ covFInv @ meanF
+        g2 = onesF @ covFInv @ onesF
+        if wB is None:
+            g = -lam * g1 / g2 + 1 / g2
+            w1 = 0
+        else:
+            w1 = covFInv @ covFB @ wB
+            g = -lam * g1 / g2 + (1 - wB.sum() + onesF @ w1) / g2
+        return -w1 + g * (covFInv @ onesF) + lam * (covFInv @ meanF)
+
+    def turningPoints(self, meanReturns):
+        numAssets = len(meanReturns)
+        lowerBounds, upperBounds = self.lowerBounds, self.upperBounds
+
+        ## Start from the highest-return corner: fill assets by descending mean up to their bounds
+        order = np.argsort(meanReturns, kind="stable")
+        weights = lowerBounds.copy()
+        i = numAssets
+        while weights.sum() < 1 and i > 0:
+            i -= 1
+            weights[order[i]] = upperBounds[order[i]]
+        weights[order[i]] += 1 - weights.sum()
+        free = [order[i]]
+
+        points = [weights.copy()]
+        lambdas = [None]
+        ## Asset whose status changed at the previous turning point. Letting it flip straight
+        ## back at a rounding-level smaller lambda would make the algorithm cycle.
+        changed = None
+        while True:
+            ## a) a free weight moves to one of its bounds
+            lIn, iIn, biIn = -np.inf, None, None
+            if len(free) > 1:
+                covF, covFB, meanF, wB = self.matrices(meanReturns, free, weights)
+                covFInv = np.linalg.inv(covF)
+                lam, bi = self.lambdasIn(
+                    covFInv, covFB, meanF, wB, lowerBounds[free], upperBounds[free]
+                )
+                lam[[asset == changed for asset in free]] = np.nan
+                if not np.all(np.isnan(lam)):
+                    j = np.nanargmax(lam)
+                    lIn, iIn, biIn = lam[j], free[j], bi[j]
+
+            ## b) a bounded weight becomes free
+            lOut, iOut = -np.inf, None
+            if len(free) < numAssets:
+                bounded = [i for i in range(numAssets) if i not in free]
+                covFInv = np.linalg.inv(self.covMatrix[np.ix_(free, free)])
+                lam = self.lambdasOut(meanReturns, free, bounded, covFInv, weights)
+                if lambdas[-1] is not None:
+                    lam[lam >= lambdas[-1]] = np.nan
+                lam[[asset == changed for asset in bounded]] = np.nan
+                if not np.all(np.isnan(lam)):
+                    j = np.nanargmax(lam)
+                    lOut, iOut = lam[j], bounded[j]
+
+            if lIn < 0 and lOut < 0:
+                ## Neither event happens for a positive lambda: the next point is minimum variance
+                lambdas.append(0.0)
+                covF, covFB, meanF, wB = self.matrices(meanReturns, free, weights)
+                meanF = np.zeros(len(meanF))
+            else:
+                if lIn > lOut:
+                    lambdas.append(lIn)
+                    free.remove(iIn)
+                    weights[iIn] = biIn
+                    changed = iIn
+                else:
+                    lambdas.append(lOut)
+                    free.append(iOut)
+                    changed = iOut
+                covF, covFB, meanF, wB = self.matrices(meanReturns, free, weights)
+
+            covFInv = np.linalg.inv(covF)
+            weights[free] = self.computeWeights(covFInv, covFB, meanF, wB, lambdas[-1])
+            points.append(weights.copy())
+            if lambdas[-1] == 0:
+                break
+
+        points = np.array(points)
+        valid = (
+            (np.abs(points.sum(axis=1) - 1) < 1e-8)
+            & np.all(points >= lowerBounds - 1e-8, axis=1)
+            & np.all(points <= upperBounds + 1e-8, axis=1)
+        )
+        return points[valid]
+
+    def frontier(self, targetReturns):
+        targetReturns = np.clip(
+            np.asarray(targetReturns, dtype=np.float64), self.cornerReturns[0], self.cornerReturns[-1]
+        )
+        if len(self.cornerReturns) == 1:
+            weights = np.repeat(self.cornerWeights, len(targetReturns), axis=0)
+        else:
+            segment = np.searchsorted(self.cornerReturns, targetReturns).clip(1, len(self.cornerReturns) - 1)
+            r0, r1 = self.cornerReturns[segment - 1], self.cornerReturns[segment]
+            t = ((targetReturns - r0) / (r1 - r0))[:, None]
+            weights = self.cornerWeights[segment - 1] + t * (self.cornerWeights[segment] - self.cornerWeights[segment - 1])
+        volatility = np.sqrt(np.einsum("ij,ij->i", weights @ self.covMatrix, weights))
+        return weights, volatility
+
+    def tangency(self, riskFreeRates):
+        ## Maximum Sharpe portfolio on the frontier for each risk-free rate (in the units of the
+        ## mean returns). Between corner portfolios w = w0 + t (w1 - w0), so on each segment the
+        ## Sharpe ratio is (a + b t) / sqrt(c + 2 d t + e t^2), whose only stationary point is
+        ## t = (a d - b c) / (b d - a e). Every segment and rate is checked at once.
+        rates = np.atleast_1d(np.asarray(riskFreeRates, dtype=np.float64))[:, None]
+        if len(self.cornerReturns) == 1:
+            weights = np.repeat(self.cornerWeights, len(rates), axis=0)
+            volatility = np.sqrt(self.cornerWeights[0] @ self.covMatrix @ self.cornerWeights[0])
+            return weights, (self.cornerReturns[0] - rates[:, 0]) / volatility
+
+        w0, step = self.cornerWeights[:-1], np.diff(self.cornerWeights, axis=0)
+        a = self.cornerReturns[:-1] - rates
+        b = np.diff(self.cornerReturns)
+        c = np.einsum("ij,ij->i", w0 @ self.covMatrix, w0)
+        d = np.einsum("ij,ij->i", w0 @ self.covMatrix, step)
+        e = np.einsum("ij,ij->i", step @ self.covMatrix, step)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            stationary = np.nan_to_num((a * d - b * c) / (b * d - a * e)).clip(0, 1)
+
+        ## Candidates per rate: both ends and the stationary point of every segment
+        t = np.stack([np.zeros_like(a), np.ones_like(a), stationary])
+        sharpe = (a + b * t) / np.sqrt(np.maximum(c + 2 * d * t + e * t**2, 1e-300))
+        flat = sharpe.transpose(1, 0, 2).reshape(len(rates), -1)
+        best = flat.argmax(axis=1)
+        candidate, segment = np.divmod(best, len(b))
+        chosen = t[candidate, np.arange(len(rates)), segment]
+        weights = w0[segment] + chosen[:, None] * step[segment]
+        return weights, flat[np.arange(len(rates)), best]
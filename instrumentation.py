@@ -0,0 +1,142 @@
+import json
+import time
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager, nullcontext
+
+
+class Instrumentation:
+    ## Timing spans, counters and per-solve statistics for one request. Code records into
+    ## whichever instance is active in the current context, so nothing has to be threaded
+    ## through call signatures and recording is a no-op when no instance is active.
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.spans = []
+        self.counters = {}
+        self.solves = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, **attributes):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            finished = time.perf_counter()
+            with self.lock:
+                self.spans.append(
+                    {
+                        "name": name,
+                        "start": round(started - self.origin, 6),
+                        "duration": round(finished - started, 6),
+                        **attributes,
+                    }
+                )
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def recordSolve(self, name, result, duration, objectiveCalls=None, gradientCalls=None):
+        with self.lock:
+            self.solves.append(
+                {
+                    "name": name,
+                    "duration": round(duration, 6),
+                    "iterations": result.get("nit"),
+                    "objectiveEvaluations": objectiveCalls,
+                    "gradientEvaluations": gradientCalls,
+                    "success": bool(result.get("success", True)),
+                }
+            )
+
+    def spanTable(self):
+        ## Total time and call count per span name, slowest first
+        import pandas as pd
+
+        spans = pd.DataFrame(self.spans, columns=["name", "start", "duration"])
+        table = spans.groupby("name")["duration"].agg(["count", "sum"]).reset_index()
+        table.columns = ["Stage", "Calls", "Seconds"]
+        return table.sort_values("Seconds", ascending=False, ignore_index=True)
+
+    def toDict(self):
+        return {
+            "totalSeconds": round(time.perf_counter() - self.origin, 6),
+            "spans": self.spans,
+            "counters": self.counters,
+            "solves": self.solves,
+        }
+
+    def toJson(self):
+        return json.dumps(self.toDict(), indent=2, default=str)
+
+    @contextmanager
+    def active(self):
+        token = _active.set(self)
+        try:
+            yield self
+        finally:
+            _active.reset(token)
+
+
+_active = contextvars.ContextVar("instrumentation", default=None)
+
+
+def current():
+    return _active.get()
+
+
+def span(name, **attributes):
+    instrumentation = _active.get()
+    return instrumentation.span(name, **attributes) if instrumentation else nullcontext()
+
+
+def count(name, amount=1):
+    instrumentation = _active.get()
+    if instrumentation:
+        instrumentation.count(name, amount)
+
+
+def timed(name):
+    ## Decorator form of span() for whole methods
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class CountedCall:
+    ## Wraps an objective or gradient so a solve can report how often SciPy called it
+
+    def __init__(self, function):
+        self.function = function
+        self.calls = 0
+
+    def __call__(self, *args):
+        self.calls += 1
+        return self.function(*args)
+
+
+@contextmanager
+def solve(name, objective=None, gradient=None):
+    ## Yields a dict the caller stores the optimizer result in under "result"
+    record = {}
+    started = time.perf_counter()
+    with span("solve", criterion=name):
+        yield record
+    instrumentation = _active.get()
+    if instrumentation and "result" in record:
+        instrumentation.recordSolve(
+            name,
+            record["result"],
+            time.perf_counter() - started,
+            objective.calls if objective else None,
+            gradient.calls if gradient else None,
+        )
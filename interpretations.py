@@ -1,5 +1,4 @@
 import streamlit as st
-from risk import RiskMetrics
 
 def metric_info():
     st.write("")
@@ -0,0 +1,27 @@
+import threading
+
+
+class lazyProperty:
+    ## Like functools.cached_property, computed on first access and then stored on the
+    ## instance, but locked per instance. Up to Python 3.11 cached_property holds one lock per
+    ## attribute across every instance, so sessions computing the same stage ran one at a time.
+
+    def __init__(self, func):
+        self.func = func
+        self.__doc__ = func.__doc__
+
+    def __set_name__(self, owner, name):
+        self.name = name
+        self.lockName = f"_{name}Lock"
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        cache = instance.__dict__
+        if self.name in cache:
+            return cache[self.name]
+        ## dict.setdefault is atomic, so racing threads still end up with the same lock
+        with cache.setdefault(self.lockName, threading.RLock()):
+            if self.name not in cache:
+                cache[self.name] = self.func(instance)
+            return cache[self.name]
@@ -1,14 +1,71 @@
 
+import os
+import threading
+import importlib
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import datetime as dt
+import numpy as np
 import pandas as pd
 import streamlit as st
-import plotly.express as px
 import streamlit_shadcn_ui as ui
 from PIL import Image
 from interpretations import metric_info, var_info, optimization_strategies_info, appinfo
-from portfolio_optimizer import PortfolioOptimizer
-from metrics import MetricsCalculator
-from risk import RiskMetrics
+from criteria import OPTIMIZATION_CRITERIA, COVARIANCE_ESTIMATORS
+from instrumentation import Instrumentation
+from result_cache import ResultCache
+
+
+## Shared by every user of this server process, configurable through the environment
+@st.cache_resource
+def resultCache():
+    return ResultCache(
+        ttl=float(os.environ.get("RESULT_CACHE_TTL", 900)),
+        maxBytes=int(float(os.environ.get("RESULT_CACHE_MAX_MB", 256)) * 1024 * 1024),
+    )
+
+
+## Set UNIVERSE_PANEL_DIR to serve prices from a prebuilt universe panel (universe_panel.py),
+## tickers outside it still come from the price cache
+@st.cache_resource
+def priceSource():
+    if not os.environ.get("UNIVERSE_PANEL_DIR"):
+        return None
+    from price_cache import defaultPriceCache
+    from universe_panel import UniversePanel
+
+    return UniversePanel(fallback=defaultPriceCache())
+
+
+## The analytics stack (SciPy, Plotly) is only needed once Calculate is
+## pressed. Importing it on a background thread lets the first page render straight away
+## while the imports finish in the time the user spends filling in the form.
+HEAVY_MODULES = ["session", "plotly.express", "plotly.graph_objects"]
+
+
+## Background stages of every dashboard session; they spend most of their time in NumPy and
+## SciPy, which release the GIL, so threads are enough
+@st.cache_resource
+def stageExecutor():
+    return ThreadPoolExecutor(max_workers=int(os.environ.get("STAGE_WORKERS", 4)))
+
+
+## Walk-forward backtests and objective comparisons of every session share one bounded pool,
+## so concurrent users can't fork a pool each. Spawned workers don't inherit the server's
+## threads and locks, and the processes only start with the first task.
+@st.cache_resource
+def processPool():
+    workers = int(os.environ.get("PROCESS_WORKERS", 2))
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")), workers
+
+
+@st.cache_resource
+def prewarm():
+    thread = threading.Thread(
+        target=lambda: [importlib.import_module(name) for name in HEAVY_MODULES], daemon=True
+    )
+    thread.start()
+    return thread
 
 
 def main():
@@ -58,14 +115,7 @@ def main():
     col1, col2 = cont1.columns(2)
     optimization_criterion = col1.selectbox(
         "Optimization Objective",
-        options=[
-            "Maximize Sharpe Ratio",
-            "Minimize Volatility",
-            "Maximize Sortino Ratio",
-            "Minimize Tracking Error",
-            "Maximize Information Ratio",
-            "Minimize Conditional Value-at-Risk",
-        ],
+        options=OPTIMIZATION_CRITERIA,
     )
     riskFreeRate_d = col2.number_input(
         "Risk Free Rate (%)",
@@ -76,76 +126,123 @@ def main():
         value=6.880,
         help = "10 Year Bond Yield"
     )
+    covarianceEstimator = cont1.selectbox(
+        "Covariance Estimator",
+        options=COVARIANCE_ESTIMATORS,
+        help="Shrinkage and factor models stay stable when there are many tickers and few days",
+    )
+    compare = cont1.checkbox(
+        "Compare all objectives",
+        help="Solve every optimization objective on the same data and show them side by side",
+    )
+    backtest = cont1.checkbox(
+        "Walk-forward backtest",
+        help="Re-optimize monthly on the previous year (half the range when shorter) and score the weights on the month after",
+    )
+    debug = cont1.checkbox(
+        "Show debug timings",
+        help="Per-stage timings, solver statistics and cache hits for this run",
+    )
     calc = cont1.button("Calculate")
     riskFreeRate = riskFreeRate_d / 100
 
     st.session_state.stocks_list = [s.strip() for s in stocks.split(",")]
 
+    prewarm()
+
     if calc:
+        ## Kept across reruns, so interacting with any widget does not throw the results away
+        st.session_state.analysis = {
+            "inputs": (
+                st.session_state.stocks_list,
+                start_date,
+                end_date,
+                optimization_criterion,
+                riskFreeRate,
+                covarianceEstimator,
+            ),
+            "stages": (compare, backtest),
+            "instrumentation": Instrumentation(),
+            "session": None,
+        }
+
+    analysis = st.session_state.get("analysis")
+    if analysis is None:
+        return
+
+    from session import AnalysisSession
+    import plotly.express as px
+
+    stocks_list, start_date, end_date, optimization_criterion, riskFreeRate, covarianceEstimator = analysis["inputs"]
+    instrumentation = analysis["instrumentation"]
+    with instrumentation.active():
         try:
-            with st.spinner("Buckle Up! Financial Wizardry in Progress...."):
-                stocks_list = st.session_state.stocks_list
-                optimizer = PortfolioOptimizer(
-                    stocks_list,
-                    start_date,
-                    end_date,
-                    optimization_criterion,
-                    riskFreeRate,
-                )
-                optimizer.optimized_allocation.index = [
-                    stock.replace(".NS", "")
-                    for stock in optimizer.optimized_allocation.index
-                ]
-                ret, std = optimizer.basicMetrics()
-                if not (len(ret.columns) == len(stocks_list)):
-                    missing_tickers = set(stocks_list) - set(ret.columns)
-                    raise ValueError(
-                        f"Data for the following tickers could not be retrieved: {', '.join(missing_tickers)}"
+            session, onDone = analysis["session"], None
+            if session is None:
+                ## Only the Summary stage blocks; every other tab fills in from the background
+                with st.spinner("Buckle Up! Financial Wizardry in Progress...."):
+                    session = AnalysisSession(
+                        stocks_list,
+                        start_date,
+                        end_date,
+                        optimization_criterion,
+                        riskFreeRate,
+                        priceSource=priceSource(),
+                        covarianceEstimator=covarianceEstimator,
+                        frontierCache=resultCache(),
+                        processPool=processPool(),
                     )
+                    cache, key = resultCache(), session.cacheKey()
+                    session = cache.get(key, session.summary)
+                    onDone = lambda: cache.resize(key)
+                analysis["session"] = session
+            ## Reruns get the futures already running rather than new ones
+            futures = session.startStages(stageExecutor(), AnalysisSession.stageNames(*analysis["stages"]), onDone)
 
-                optimizer.optimized_allocation.columns = ["Allocation (%)"]
-                optimizer.optimized_allocation["Allocation (%)"] = [
-                    round(i * 100, 2)
-                    for i in optimizer.optimized_allocation["Allocation (%)"]
-                ]
-
-                metrics = MetricsCalculator(
-                    stocks_list,
-                    start_date,
-                    end_date,
-                    optimization_criterion,
-                    riskFreeRate,
-                )
-                
-                metric_df = metrics.metricDf()
-                metric_df = pd.DataFrame(list(metric_df.items()))
-                metric_df.columns = ["Metric", "Value"]
-
-                riskM = RiskMetrics(
-                    stocks_list,
-                    start_date,
-                    end_date,
-                    optimization_criterion,
-                    riskFreeRate,
+            optimizer = session.optimizer
+            allocations = optimizer.optimized_allocation.copy()
+            allocations.index = [
+                stock.replace(".NS", "")
+                for stock in allocations.index
+            ]
+            ret = optimizer.context.returns
+            if not (len(ret.columns) == len(stocks_list)):
+                missing_tickers = set(stocks_list) - set(ret.columns)
+                raise ValueError(
+                    f"Data for the following tickers could not be retrieved: {', '.join(missing_tickers)}"
                 )
 
+            allocations.columns = ["Allocation (%)"]
+            allocations["Allocation (%)"] = [
+                round(i * 100, 2)
+                for i in allocations["Allocation (%)"]
+            ]
+
+            metrics = session.metrics
+
         except ValueError as e:
+            del st.session_state.analysis
             st.error("Unable to download data for one or more tickers!")
             return
         except Exception as e:
+            del st.session_state.analysis
             st.error(str(e))
             return
 
         with st.container(border=True):
-            tab1, tab2, tab3, tab4, tab5 = st.tabs(
-                [
-                    "Summary",
-                    "Efficient Frontier",
-                    "Metrics",
-                    "Portfolio Returns",
-                    "Risk Analysis",
-                ]
-            )
+            tabNames = [
+                "Summary",
+                "Efficient Frontier",
+                "Metrics",
+                "Portfolio Returns",
+                "Risk Analysis",
+            ]
+            if "comparison" in futures:
+                tabNames.append("Objective Comparison")
+            if "backtest" in futures:
+                tabNames.append("Walk-Forward Backtest")
+            tabs = st.tabs(tabNames)
+            tab1, tab2, tab3, tab4, tab5 = tabs[:5]
             with tab1:
                 st.markdown("#### Optimized Portfolio Performance")
                 col1, col2 = st.columns(2)
@@ -160,13 +257,13 @@ def main():
                 st.markdown("#### Optimized Portfolio Allocation")
                 alocCol, pieCol = st.columns(2)
                 with alocCol:
-                    allocations = optimizer.optimized_allocation
-                    allocations["Tickers"] = allocations.index
-                    allocations = allocations[["Tickers", "Allocation (%)"]]
-                    ui.table(allocations)
+                    allocationTable = allocations.copy()
+                    allocationTable["Tickers"] = allocationTable.index
+                    allocationTable = allocationTable[["Tickers", "Allocation (%)"]]
+                    ui.table(allocationTable)
                 with pieCol:
-                    sharpeChart = optimizer.optimized_allocation[
-                        optimizer.optimized_allocation["Allocation (%)"] != 0
+                    sharpeChart = allocations[
+                        allocations["Allocation (%)"] != 0
                     ]
                     fig = px.pie(
                         sharpeChart, values="Allocation (%)", names=sharpeChart.index
@@ -180,33 +277,207 @@ def main():
                     st.plotly_chart(fig, use_container_width=True)
 
             with tab2:
-                st.markdown("#### Efficient Frontier Assets")
-                frontierAssets, matrix = optimizer.frontierStats()
-                ui.table(frontierAssets)
-                st.markdown("#### Asset Correlations")
-                ui.table(matrix)
-                st.markdown("*(Higher Value Represents Higher Correlation)*")
-                st.markdown("#### Efficient Frontier Graph")
-                optimizer.EF_graph()
-
+                stageFragment(futures["frontier"], frontierPanel, session)
             with tab3:
-                st.markdown("#### Risk and Return Metrics")
-                ui.table(metric_df)
-                with st.expander("Metric Interpretations:"):
-                    metric_info()
-
+                stageFragment(futures["metrics"], metricsPanel, session)
             with tab4:
-                st.markdown("#### Cumulative Portfolio Returns")
-                metrics.portfolioReturnsGraph()
-
+                stageFragment(futures["returns"], returnsPanel, session)
             with tab5:
-                st.markdown("#### VaR and CVaR")
-                var = riskM.riskTable()
-                ui.table(var)
-                with st.expander("VaR and CVar Interpretation"):
-                    var_info()
-                st.markdown("#### VaR Breaches")
-                riskM.varXReturns()
+                stageFragment(futures["risk"], riskPanel, session)
+                stageFragment(futures["riskMethods"], riskMethodsPanel, session)
+                stageFragment(futures["cvarFrontier"], cvarFrontierPanel, session)
+            if "comparison" in futures:
+                with tabs[tabNames.index("Objective Comparison")]:
+                    stageFragment(futures["comparison"], comparisonPanel, session)
+            if "backtest" in futures:
+                with tabs[tabNames.index("Walk-Forward Backtest")]:
+                    stageFragment(futures["backtest"], backtestPanel, session)
+
+        if debug:
+            debugPanel(instrumentation)
+
+
+## Seconds between checks of a stage that is still running
+POLL_INTERVAL = 0.5
+
+STAGE_MESSAGES = {
+    "frontierPanel": "Tracing the efficient frontier...",
+    "metricsPanel": "Computing risk and return metrics...",
+    "returnsPanel": "Computing rolling statistics...",
+    "riskPanel": "Computing VaR and CVaR...",
+    "riskMethodsPanel": "Simulating VaR and CVaR...",
+    "cvarFrontierPanel": "Tracing the CVaR frontier...",
+    "comparisonPanel": "Solving every objective...",
+    "backtestPanel": "Running the walk-forward backtest...",
+}
+
+
+def stageFragment(future, panel, session):
+    ## Shows one tab as a fragment, so it reruns on its own. While the tab's stage is running
+    ## the fragment polls it; the first poll that finds it done reruns the whole app once, and
+    ## that run draws every finished tab without polling.
+    pending = not future.done()
+
+    @st.fragment(run_every=POLL_INTERVAL if pending else None)
+    def fragment():
+        if not future.done():
+            st.info(STAGE_MESSAGES[panel.__name__])
+            return
+        if pending:
+            st.rerun()
+        error = future.exception()
+        if isinstance(error, ValueError):
+            ## e.g. a date range too short for the backtest; it only disables this tab
+            st.warning(str(error))
+        elif error is not None:
+            st.error(str(error))
+        else:
+            panel(session)
+
+    fragment()
+
+
+def frontierPanel(session):
+    st.markdown("#### Efficient Frontier Assets")
+    frontierAssets, matrix = session.frontierStats
+    ui.table(frontierAssets)
+    st.markdown("#### Asset Correlations")
+    ui.table(matrix)
+    st.markdown("*(Higher Value Represents Higher Correlation)*")
+    st.markdown("#### Efficient Frontier Graph")
+    session.optimizer.EF_graph()
+    st.markdown("#### Risk-Free Rate Sensitivity")
+    rateSweepPanel(session.optimizer)
+
+
+def rateSweepPanel(optimizer):
+    ## Runs inside the tab's fragment, so moving the slider only redraws this tab. Every rate
+    ## is read off the frontier already traced, without a new solve.
+    import plotly.express as px
+
+    low, high = st.slider(
+        "Risk Free Rate range (%)",
+        min_value=0.0,
+        max_value=20.0,
+        value=(0.0, min(20.0, round(optimizer.riskFreeRate * 200, 1))),
+        step=0.1,
+    )
+    sweep = optimizer.rateSweep(np.linspace(low, high, 101) / 100)
+    if sweep.empty:
+        st.markdown("*(No portfolio beats these risk-free rates)*")
+        return
+    tickers = list(sweep.columns[4:])
+    fig = px.area(sweep, x="Risk Free Rate (%)", y=tickers, labels={"value": "Allocation (%)", "variable": "Ticker"})
+    fig.update_layout(
+        legend_title_text="",
+        legend=dict(orientation="h", yanchor="bottom", y=-0.3, xanchor="center", x=0.5),
+    )
+    st.plotly_chart(fig, use_container_width=True)
+    st.markdown("*(Maximum Sharpe Ratio allocation at each risk-free rate)*")
+
+
+def metricsPanel(session):
+    metric_df = pd.DataFrame(list(session.metricTable.items()))
+    metric_df.columns = ["Metric", "Value"]
+    st.markdown("#### Risk and Return Metrics")
+    ui.table(metric_df)
+    with st.expander("Metric Interpretations:"):
+        metric_info()
+
+
+def returnsPanel(session):
+    st.markdown("#### Cumulative Portfolio Returns")
+    session.metrics.portfolioReturnsGraph()
+    st.markdown("#### Rolling Statistics")
+    session.metrics.rollingGraph(session.rollingTable)
+
+
+def riskPanel(session):
+    st.markdown("#### VaR and CVaR")
+    ui.table(session.riskTable)
+    with st.expander("VaR and CVar Interpretation"):
+        var_info()
+    st.markdown("#### VaR Breaches")
+    session.risk.varXReturns()
+
+
+def riskMethodsPanel(session):
+    st.markdown("#### VaR and CVaR by Method")
+    st.dataframe(session.riskEngineTable, hide_index=True)
+    st.markdown("*(Monte Carlo intervals are 95% bootstrap intervals over 20,000 simulated scenarios; "
+                "blank historical rows need a longer date range)*")
+
+
+def cvarFrontierPanel(session):
+    import plotly.express as px
+
+    st.markdown("#### Return and CVaR Frontier")
+    targetReturns, cvar, weights = session.cvarFrontier
+    fig = px.line(
+        x=cvar * 100,
+        y=targetReturns * 100,
+        markers=True,
+        labels={"x": "Daily CVaR 95% (%)", "y": "Mean Daily Return (%)"},
+    )
+    fig.update_traces(line_color="#0D2A63")
+    st.plotly_chart(fig, use_container_width=True)
+    st.markdown("*(Lowest historical CVaR for each target return)*")
+
+
+def comparisonPanel(session):
+    st.markdown("#### Optimized Portfolios by Objective")
+    st.dataframe(session.comparison, hide_index=True)
+    st.markdown("*(Weights in %, all objectives solved on the same data)*")
+
+
+def backtestPanel(session):
+    import plotly.express as px
+    from metrics import metricTable
+
+    result = session.backtest
+    st.markdown("#### Out-of-Sample Cumulative Returns")
+    cumulative = pd.DataFrame(
+        {
+            "Portfolio Cumulative Return (%)": 100 * ((1 + result.returns).cumprod() - 1),
+            "Nifty Cumulative Return (%)": 100 * ((1 + result.benchmark).cumprod() - 1),
+        }
+    )
+    fig = px.line(cumulative, labels={"value": "Cumulative Return (%)", "variable": "Legend", "index": "Date"})
+    fig.update_yaxes(tickformat=".0f", ticksuffix="%")
+    fig.update_layout(
+        legend_title_text="",
+        legend=dict(orientation="h", yanchor="bottom", y=-0.3, xanchor="center", x=0.5),
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+    st.markdown("#### Out-of-Sample Metrics")
+    table = pd.DataFrame(list(metricTable(result.metrics).items()), columns=["Metric", "Value"])
+    ui.table(table)
+    st.markdown(
+        f"*({len(result.weights)} monthly rebalances on a {result.lookback}-session rolling window, "
+        f"average turnover {result.turnover.iloc[1:].mean() * 100:.1f}%)*"
+    )
+
+    st.markdown("#### Weights at Each Rebalance")
+    st.dataframe((result.weights * 100).round(2))
+
+
+def debugPanel(instrumentation):
+    with st.expander("Debug: Timings", expanded=True):
+        st.markdown(f"**Total**: {instrumentation.toDict()['totalSeconds']:.3f} s")
+        st.dataframe(instrumentation.spanTable(), hide_index=True)
+        if instrumentation.solves:
+            st.markdown("**Solves**")
+            st.dataframe(pd.DataFrame(instrumentation.solves), hide_index=True)
+        if instrumentation.counters:
+            st.markdown("**Counters**")
+            st.json(instrumentation.counters)
+        st.download_button(
+            "Download JSON",
+            instrumentation.toJson(),
+            file_name="timings.json",
+            mime="application/json",
+        )
 
 
 if __name__ == "__main__":
@@ -1,180 +1,102 @@
-from portfolio_optimizer import PortfolioOptimizer
 import numpy as np
 import pandas as pd
-import statsmodels.api as sm
-from scipy.stats import skew, kurtosis
-import streamlit as st
-import plotly.express as px
-
-
-class MetricsCalculator(PortfolioOptimizer):
-    def __init__(
-        self, stocks, start, end, optimization_criterion, riskFreeRate=0.07024
-    ):
-        super().__init__(stocks, start, end, optimization_criterion, riskFreeRate)
-        self.portfolioDaily = self.portfolioReturnsDaily()
+from metrics_kernel import computeMetrics
+from rolling import RollingAnalytics
+from instrumentation import timed
+from lazy import lazyProperty
+
+
+class MetricsCalculator:
+    def __init__(self, optimizer):
+        self.optimizer = optimizer
+        self.start = optimizer.start
+        self.riskFreeRate = optimizer.riskFreeRate
+        self.benchmark = optimizer.benchmark
+        self.portfolioDaily = optimizer.portfolioReturnsDaily()
         self.annual_return = self.MMeanReturn("annual") / 100
 
+    @lazyProperty
+    def results(self):
+        return computeMetrics(self.portfolioDaily, self.benchmark, self.riskFreeRate)
+
+    @lazyProperty
+    def rolling(self):
+        return RollingAnalytics(
+            self.portfolioDaily, self.benchmark, self.optimizer.context.dates, self.riskFreeRate
+        )
+
     def MMeanReturn(self, frequency):
         if frequency == "monthly":
-            return self.portfolioDaily.mean() * 21 * 100
+            return self.results.meanReturnMonthly
         if frequency == "annual":
-            return self.portfolioDaily.mean() * 252 * 100
+            return self.results.meanReturnAnnual
 
     def MStandardDeviation(self, frequency):
         if frequency == "monthly":
-            return self.portfolioDaily.std(ddof=1) * np.sqrt(21) * 100
+            return self.results.stdMonthly
         if frequency == "annual":
-            return self.portfolioDaily.std(ddof=1) * np.sqrt(252) * 100
+            return self.results.stdAnnual
 
     def MDownsideDeviation(self):
-        downsideChanges = self.portfolioDaily[self.portfolioDaily < 0]
-        return downsideChanges.std(ddof=1) * np.sqrt(252) * 100
+        return self.results.downsideDeviation
 
     def MMaxDrawdown(self):
-        returns = np.array(self.portfolioDaily)
-        cumulative_returns = np.cumprod(1 + returns) - 1
-        running_max = np.maximum.accumulate(cumulative_returns)
-        drawdown = cumulative_returns - running_max
-        max_drawdown = np.min(drawdown) * 100
-
-        ## Fix this calculation
-
-        return max_drawdown
+        return self.results.maxDrawdown
 
     def MBeta(self):
-        portfolio = np.array(self.portfolioDaily).flatten()
-        benchmark = np.array(self.benchmark).flatten()
-        portfolio_dates = pd.date_range(
-            start=self.start, periods=len(portfolio), freq="D"
-        )
-        benchmark_dates = pd.date_range(
-            start=self.start, periods=len(benchmark), freq="D"
-        )
-
-        portfolio_series = pd.Series(portfolio, index=portfolio_dates)
-        benchmark_series = pd.Series(benchmark, index=benchmark_dates)
-
-        common_dates = portfolio_series.index.intersection(benchmark_series.index)
-
-        aligned_portfolio = portfolio_series[common_dates]
-        aligned_benchmark = benchmark_series[common_dates]
-
-        portfolio = aligned_portfolio.tolist()
-        benchmark = aligned_benchmark.tolist()
-
-        returns_data = pd.DataFrame(
-            {"Portfolio": portfolio, "Benchmark": benchmark}
-        ).dropna()
-        X = sm.add_constant(returns_data["Benchmark"])
-        model = sm.OLS(returns_data["Portfolio"], X).fit()
-        beta = model.params["Benchmark"]
-
-        return beta
+        return self.results.beta
 
     def MAlpha(self):
-        market_return = self.benchmark.mean() * 252
-        alpha = (self.annual_return) - (
-            self.riskFreeRate + self.MBeta() * (market_return - self.riskFreeRate)
-        )
-        return alpha * 100
+        return self.results.alpha
 
     def MSharpeRatio(self):
-        annual_std = self.MStandardDeviation("annual") / 100
-        sharpe = (self.annual_return - self.riskFreeRate) / annual_std
-
-        ## fix sharpe ratio
-        return sharpe
+        return self.results.sharpeRatio
 
     def MSortinoRatio(self):
-        downside_std = self.MDownsideDeviation() / 100
-        sortino = (self.annual_return - self.riskFreeRate) / downside_std
-        return sortino
+        return self.results.sortinoRatio
 
     def MTrackingError(self):
-        portfolioDailyReturns = np.array(self.portfolioReturnsDaily())
-        benchmarkReturns = np.array(self.benchmark)
-
-        difference_array = portfolioDailyReturns - benchmarkReturns
-        trackingError = difference_array.std(ddof=1) * np.sqrt(252)
-
-        return trackingError
+        return self.results.trackingError
 
     def MInformationRatio(self):
-        trackingError = self.MTrackingError()
-        portfolioDailyReturns = np.array(self.portfolioReturnsDaily())
-        benchmarkReturns = np.array(self.benchmark)
-
-        mean_portfolio = portfolioDailyReturns.mean() * 252
-        mean_benchmark = benchmarkReturns.mean() * 252
-
-        information_ratio = (mean_portfolio - mean_benchmark) / trackingError
-
-        return information_ratio
+        return self.results.informationRatio
 
     def MTreynorRatio(self):
-        treynor = (self.annual_return - self.riskFreeRate) / self.MBeta()
-        return treynor
+        return self.results.treynorRatio
 
     def MCalmarRatio(self):
-        calmar = (self.annual_return - self.riskFreeRate) / (-self.MMaxDrawdown() / 100)
-        return calmar
+        return self.results.calmarRatio
 
     def MSkewness(self):
-        skewness = skew(self.portfolioDaily)[0]
-        return skewness
+        return self.results.skewness
 
     def MKurtosis(self):
-        kurtos = kurtosis(self.portfolioDaily)[0]
-        return 3 - kurtos
+        return self.results.kurtosis
 
     def MPositivePeriods(self):
-        positive = self.portfolioDaily[self.portfolioDaily > 0]
-        total = len(self.portfolioDaily)
-
-        positive_periods = len(positive)
-        ratio = round((positive_periods / (total)) * 100, 2)
+        positive, total = self.results.positivePeriods, self.results.totalPeriods
+        ratio = round((positive / total) * 100, 2)
 
-        return f"{positive_periods} out of {total} ({ratio}%)"
+        return f"{positive} out of {total} ({ratio}%)"
 
+    @timed("plot.returns")
     def portfolioReturnsGraph(self):
-        portfolio = np.array(self.portfolioDaily).flatten()
-        benchmark = np.array(self.benchmark).flatten()
-        ret, std = self.basicMetrics()
-        portfolio_dates = ret.index
-
-        if len(portfolio) and len(benchmark) == len(portfolio_dates):
-            portfolio_series = pd.Series(portfolio, index=portfolio_dates)
-            benchmark_series = pd.Series(benchmark, index=portfolio_dates)
-        else:
-            # Handle length mismatch: truncate or pad the shorter array
-            min_length = min(len(benchmark), len(portfolio), len(portfolio_dates))
-            portfolio_series = pd.Series(
-                portfolio[:min_length], index=portfolio_dates[:min_length]
-            )
-            benchmark_series = pd.Series(
-                benchmark[:min_length], index=portfolio_dates[:min_length]
-            )
-
-        cumulative_returns_p = 100 * ((1 + portfolio_series).cumprod() - 1)
-        cumulative_returns_b = 100 * ((1 + benchmark_series).cumprod() - 1)
+        import streamlit as st
+        import plotly.express as px
 
-        cumulative_returns_p = cumulative_returns_p.reindex(portfolio_dates)
-        cumulative_returns_p.fillna(method="ffill", inplace=True)
-
-        cumulative_returns_b = cumulative_returns_b.reindex(portfolio_dates)
-        cumulative_returns_b.fillna(method="ffill", inplace=True)
+        ## Both series live on the context's trading dates, so they line up by construction
+        context = self.optimizer.context
+        cumulative_returns_p = 100 * (np.cumprod(1 + self.portfolioDaily) - 1)
+        cumulative_returns_b = 100 * (np.cumprod(1 + context.benchmarkReturns) - 1)
 
         returns_df = pd.DataFrame(
             {
-                "Date": cumulative_returns_p.index,
-                "Nifty Cumulative Return (%)": cumulative_returns_b.values,
-                "Portfolio Cumulative Return (%)": cumulative_returns_p.values,
+                "Date": context.dates,
+                "Nifty Cumulative Return (%)": cumulative_returns_b,
+                "Portfolio Cumulative Return (%)": cumulative_returns_p,
             }
         )
 
-        returns_df.dropna(inplace=True)
-
         fig = px.line(
             returns_df,
             x="Date",
@@ -190,29 +112,73 @@ class MetricsCalculator(PortfolioOptimizer):
             ),
         )
 
-        st.markdown(f'**Portfolio Returns**: {round(cumulative_returns_p.values[-1], 2)}% ')
-        st.markdown(f'**NIFTY Returns**: {round(cumulative_returns_b.values[-1], 2)}% ')
+        st.markdown(f'**Portfolio Returns**: {round(cumulative_returns_p[-1], 2)}% ')
+        st.markdown(f'**NIFTY Returns**: {round(cumulative_returns_b[-1], 2)}% ')
         st.plotly_chart(fig)
+        excluded = len(context.excludedDates())
+        if excluded:
+            st.markdown(
+                f"*({excluded} sessions where a ticker or the NIFTY did not trade are left out)*"
+            )
+
+    @timed("plot.rolling")
+    def rollingGraph(self, rolling=None, windows=(21, 63, 252)):
+        import streamlit as st
+        import plotly.express as px
+
+        if rolling is None:
+            rolling = self.rolling.long(windows)
+        if rolling.empty:
+            st.markdown("*Not enough data for rolling statistics.*")
+            return
+        rolling = rolling.melt(id_vars=["Date", "Window"], var_name="Statistic", value_name="Value")
+
+        fig = px.line(
+            rolling,
+            x="Date",
+            y="Value",
+            color="Window",
+            facet_col="Statistic",
+            facet_col_wrap=2,
+            facet_row_spacing=0.08,
+            height=750,
+            render_mode="webgl",
+        )
+        fig.update_yaxes(matches=None, title_text="")
+        fig.for_each_annotation(lambda a: a.update(text=a.text.split("=")[-1]))
+        fig.update_layout(
+            legend_title_text="Window",
+            legend=dict(
+                orientation="h", yanchor="bottom", y=-0.15, xanchor="center", x=0.5
+            ),
+        )
+        st.plotly_chart(fig, use_container_width=True)
 
+    @timed("metricDf")
     def metricDf(self):
-        metric_df = {
-                    "Mean Return (Monthly)": f'{round(self.MMeanReturn("monthly"), 2)}%',
-                    "Mean Return (Annualised)": f'{round(self.MMeanReturn("annual"), 2)}%',
-                    "Standard Deviation (Monthly)": f'{round(self.MStandardDeviation("monthly"), 2)}%',
-                    "Standard Deviation (Annualised)": f'{round(self.MStandardDeviation("annual"), 2)}%',
-                    "Downside Standard Deviation": f"{round(self.MDownsideDeviation(), 2)}%",
-                    "Maximum Drawdown": f"{round(self.MMaxDrawdown(), 2)}%",
-                    "Beta": round(self.MBeta(), 2),
-                    "Alpha": f"{round(self.MAlpha(), 2)}%",
-                    "Sharpe Ratio": round(self.MSharpeRatio(), 2),
-                    "Sortino Ratio": round(self.MSortinoRatio(), 2),
-                    "Treynor Ratio": round(self.MTreynorRatio(), 2),
-                    "Calmar Ratio": round(self.MCalmarRatio(), 2),
-                    "Tracking Error": round(self.MTrackingError(), 2),
-                    "Information Ratio": round(self.MInformationRatio(), 2),
-                    "Skewness": round(self.MSkewness(), 2),
-                    "Excess Kurtosis": round(self.MKurtosis(), 2),
-                    "Positive Periods": self.MPositivePeriods(),
+        return metricTable(self.results)
+
+
+def metricTable(r):
+    ## Display strings for a PortfolioMetrics, as shown on the Metrics tab
+    positive = round((r.positivePeriods / r.totalPeriods) * 100, 2)
+    metric_df = {
+                    "Mean Return (Monthly)": f"{round(r.meanReturnMonthly, 2)}%",
+                    "Mean Return (Annualised)": f"{round(r.meanReturnAnnual, 2)}%",
+                    "Standard Deviation (Monthly)": f"{round(r.stdMonthly, 2)}%",
+                    "Standard Deviation (Annualised)": f"{round(r.stdAnnual, 2)}%",
+                    "Downside Standard Deviation": f"{round(r.downsideDeviation, 2)}%",
+                    "Maximum Drawdown": f"{round(r.maxDrawdown, 2)}%",
+                    "Beta": round(r.beta, 2),
+                    "Alpha": f"{round(r.alpha, 2)}%",
+                    "Sharpe Ratio": round(r.sharpeRatio, 2),
+                    "Sortino Ratio": round(r.sortinoRatio, 2),
+                    "Treynor Ratio": round(r.treynorRatio, 2),
+                    "Calmar Ratio": round(r.calmarRatio, 2),
+                    "Tracking Error": round(r.trackingError, 2),
+                    "Information Ratio": round(r.informationRatio, 2),
+                    "Skewness": round(r.skewness, 2),
+                    "Excess Kurtosis": round(r.kurtosis, 2),
+                    "Positive Periods": f"{r.positivePeriods} out of {r.totalPeriods} ({positive}%)",
                 }
-        return metric_df
-        
\ No newline at end of file
+    return metric_df
@@ -0,0 +1,81 @@
+from dataclasses import dataclass, asdict
+import numpy as np
+
+
+@dataclass(frozen=True)
+class PortfolioMetrics:
+    ## Performance statistics of one daily return series against the benchmark. Returns,
+    ## deviations and drawdown are in percent, ratios are plain numbers.
+
+    meanReturnMonthly: float
+    meanReturnAnnual: float
+    stdMonthly: float
+    stdAnnual: float
+    downsideDeviation: float
+    maxDrawdown: float
+    beta: float
+    alpha: float
+    sharpeRatio: float
+    sortinoRatio: float
+    treynorRatio: float
+    calmarRatio: float
+    trackingError: float
+    informationRatio: float
+    skewness: float
+    kurtosis: float
+    positivePeriods: int
+    totalPeriods: int
+
+    def toDict(self):
+        return asdict(self)
+
+
+def computeMetrics(portfolio, benchmark, riskFreeRate):
+    ## Every statistic in one vectorized pass over the aligned daily return vectors. Beta
+    ## is the OLS slope in closed form, cov(portfolio, benchmark) / var(benchmark).
+    portfolio = np.asarray(portfolio, dtype=np.float64).ravel()
+    benchmark = np.asarray(benchmark, dtype=np.float64).ravel()
+    n = len(portfolio)
+
+    mean = portfolio.mean()
+    centered = portfolio - mean
+    centeredBenchmark = benchmark - benchmark.mean()
+    m2 = centered @ centered / n
+    m3 = (centered**3).sum() / n
+    m4 = (centered**2) @ (centered**2) / n
+    std = np.sqrt(m2 * n / (n - 1))
+
+    negative = portfolio[portfolio < 0]
+    downside = negative.std(ddof=1) * np.sqrt(252)
+
+    cumulative = np.cumprod(1 + portfolio) - 1
+    maxDrawdown = (cumulative - np.maximum.accumulate(cumulative)).min()
+
+    beta = (centered @ centeredBenchmark) / (centeredBenchmark @ centeredBenchmark)
+    annualReturn = mean * 252
+    marketReturn = benchmark.mean() * 252
+    excess = annualReturn - riskFreeRate
+
+    active = portfolio - benchmark
+    trackingError = active.std(ddof=1) * np.sqrt(252)
+
+    return PortfolioMetrics(
+        meanReturnMonthly=mean * 21 * 100,
+        meanReturnAnnual=annualReturn * 100,
+        stdMonthly=std * np.sqrt(21) * 100,
+        stdAnnual=std * np.sqrt(252) * 100,
+        downsideDeviation=downside * 100,
+        maxDrawdown=maxDrawdown * 100,
+        beta=beta,
+        alpha=(annualReturn - (riskFreeRate + beta * (marketReturn - riskFreeRate))) * 100,
+        sharpeRatio=excess / (std * np.sqrt(252)),
+        sortinoRatio=excess / downside,
+        treynorRatio=excess / beta,
+        calmarRatio=excess / -maxDrawdown,
+        trackingError=trackingError,
+        informationRatio=(annualReturn - marketReturn) / trackingError,
+        skewness=m3 / m2**1.5,
+        kurtosis=3 - (m4 / m2**2 - 3),
+        positivePeriods=int((portfolio > 0).sum()),
+        totalPeriods=n,
+    )
@@ -0,0 +1,46 @@
+import numpy as np
+
+
+class IncrementalMoments:
+    ## Running mean and covariance of asset returns that can take rows in and drop them out.
+    ## Sums are kept around a fixed shift (the mean of the first window) so the cross products
+    ## stay small and the one-pass covariance formula keeps its precision. Each update costs
+    ## O(k n^2) for k rows, independent of how much history the window holds.
+
+    def __init__(self, assetReturns):
+        assetReturns = np.asarray(assetReturns, dtype=np.float64)
+        self.shift = assetReturns.mean(axis=0)
+        centered = assetReturns - self.shift
+        self.count = len(assetReturns)
+        self.sums = centered.sum(axis=0)
+        self.products = centered.T @ centered
+
+    def copy(self):
+        moments = object.__new__(IncrementalMoments)
+        moments.shift = self.shift
+        moments.count = self.count
+        moments.sums = self.sums.copy()
+        moments.products = self.products.copy()
+        return moments
+
+    def add(self, rows):
+        centered = np.atleast_2d(np.asarray(rows, dtype=np.float64)) - self.shift
+        self.count += len(centered)
+        self.sums += centered.sum(axis=0)
+        self.products += centered.T @ centered
+        return self
+
+    def remove(self, rows):
+        centered = np.atleast_2d(np.asarray(rows, dtype=np.float64)) - self.shift
+        if len(centered) >= self.count - 1:
+            raise ValueError("Not enough overlapping data for the selected dates!")
+        self.count -= len(centered)
+        self.sums -= centered.sum(axis=0)
+        self.products -= centered.T @ centered
+        return self
+
+    def mean(self):
+        return self.shift + self.sums / self.count
+
+    def cov(self):
+        return (self.products - np.outer(self.sums, self.sums) / self.count) / (self.count - 1)
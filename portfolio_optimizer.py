@@ -1,43 +1,153 @@
 
-import yfinance as yf
+import hashlib
+from statistics import NormalDist
 import numpy as np
 import scipy.optimize as sc
 import pandas as pd
-import streamlit as st
-import matplotlib.pyplot as plt
-import plotly.express as px
-from scipy.stats import norm
+from price_cache import defaultPriceCache
+from returns_context import ReturnsContext
+from moments import IncrementalMoments
+from covariance import DenseCovariance, estimateCovariance
+from simulator import PortfolioSimulator, decimate
+from frontier import FrontierEngine
+from cvar import CVaROptimizer
+from instrumentation import timed, solve, CountedCall
+from criteria import OPTIMIZATION_CRITERIA
+from lazy import lazyProperty
+
+
+def solveCriterion(optimizer, criterion):
+    ## Runs in a worker process of compareCriteria
+    return optimizer.optimization_function(criterion=criterion)
 
 
 class PortfolioOptimizer:
 
     def __init__(
-        self, stocks, start, end, optimization_criterion, riskFreeRate=0.07024):
+        self, stocks, start, end, optimization_criterion, riskFreeRate=0.07024, priceSource=None,
+        noOfPortfolios=10000, seed=None, covarianceEstimator="Sample", frontierCache=None):
         self.stocks = [stock + ".NS" for stock in stocks]  
         self.start = start
         self.end = end
         self.optimization_criterion = optimization_criterion
         self.riskFreeRate = riskFreeRate
+        self.priceSource = priceSource if priceSource is not None else defaultPriceCache()
+        self.noOfPortfolios = noOfPortfolios
+        self.seed = seed
+        self.covarianceEstimator = covarianceEstimator
+        self.frontierCache = frontierCache
+        ## Previous solutions to start from, filled in by advance()
+        self.warmStarts = {}
+        self.warmFrontier = None
+        self.solutions = {}
+        self.context = self.returnsContext()
+        self.benchmark = self.context.benchmark
         self.meanReturns, self.covMatrix = self.getData()
-        self.benchmark = self.benchmarkReturns()
         (
             self.optimized_returns,
             self.optimized_std,
             self.optimized_allocation,
-            self.efficientList,
-            self.targetReturns,
         ) = self.calculatedResults()
 
+    ## The frontier is only needed by the Efficient Frontier tab, so it is traced on first use
+    @lazyProperty
+    def frontier(self):
+        return self.shared("frontier", self.frontierResults)
+
+    @property
+    def efficientList(self):
+        return self.frontier[0]
+
+    @property
+    def targetReturns(self):
+        return self.frontier[1]
+
+    @property
+    def efficientWeights(self):
+        return self.frontier[2]
+
+    @lazyProperty
+    @timed("frontierEngine")
+    def frontierEngine(self):
+        return self.shared("frontierEngine", lambda: FrontierEngine(self.meanReturns, self.covMatrix))
+
+    @lazyProperty
+    def fingerprint(self):
+        ## Identifies the data the frontier, corner portfolios and simulations are built from
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(repr((list(self.context.tickers), self.covarianceEstimator, self.noOfPortfolios, self.seed)).encode())
+        digest.update(np.ascontiguousarray(self.context.assetReturns).tobytes())
+        return digest.hexdigest()
+
+    def shared(self, name, compute):
+        ## Stages that depend on neither the risk-free rate nor the criterion are kept in
+        ## `frontierCache` per data fingerprint, so another optimizer over the same data reuses them
+        if self.frontierCache is None:
+            return compute()
+        return self.frontierCache.get(("frontier", self.fingerprint, name), compute)
+
+    @lazyProperty
+    def moments(self):
+        return IncrementalMoments(self.context.assetReturns)
+
+    @timed("advance")
+    def advance(self, end, slide=True):
+        ## Optimizer for the same portfolio with `end` moved forward. Only the new rows are
+        ## fetched and folded into the moments (dropping as many old rows when `slide` keeps
+        ## the window length fixed), and every solve starts from today's solution.
+        last = self.context.dates[-1]
+        stockData = self.priceSource.getPrices(self.stocks, last, end)
+        benchmarkData = self.priceSource.getPrices(["^NSEI"], last, end)
+        if len(stockData.columns) != len(self.stocks) or "^NSEI" not in benchmarkData:
+            raise ValueError("Unable to download data for one or more tickers!")
+        returns = stockData.pct_change().loc[stockData.index > last]
+        benchmark = benchmarkData["^NSEI"].pct_change().loc[benchmarkData.index > last]
+
+        context = self.context.advance(returns, benchmark, slide)
+        added = int((context.dates > last).sum())
+        moments = self.moments.copy().add(context.assetReturns[len(context.dates) - added:])
+        if slide:
+            moments.remove(self.context.assetReturns[:added])
+
+        optimizer = object.__new__(PortfolioOptimizer)
+        optimizer.stocks = self.stocks
+        ## A fresh build from `start` yields returns from the day after it, as here
+        optimizer.start = self.context.dates[added - 1].date() if slide and added else self.start
+        optimizer.end = end
+        optimizer.optimization_criterion = self.optimization_criterion
+        optimizer.riskFreeRate = self.riskFreeRate
+        optimizer.priceSource = self.priceSource
+        optimizer.noOfPortfolios = self.noOfPortfolios
+        optimizer.seed = self.seed
+        optimizer.covarianceEstimator = self.covarianceEstimator
+        optimizer.frontierCache = self.frontierCache
+        optimizer.warmStarts = {**self.warmStarts, **self.solutions}
+        optimizer.warmFrontier = self.__dict__["frontier"][2] if "frontier" in self.__dict__ else self.warmFrontier
+        optimizer.solutions = {}
+        optimizer.context = context
+        optimizer.moments = moments
+        optimizer.benchmark = context.benchmark
+        optimizer.meanReturns = pd.Series(moments.mean(), index=context.tickers)
+        ## Only the sample estimator is a plain function of the moments
+        if self.covarianceEstimator == "Sample":
+            optimizer.covModel = DenseCovariance(moments.cov())
+        else:
+            optimizer.covModel = estimateCovariance(context.assetReturns, self.covarianceEstimator)
+        optimizer.covMatrix = pd.DataFrame(optimizer.covModel.dense(), index=context.tickers, columns=context.tickers)
+        (
+            optimizer.optimized_returns,
+            optimizer.optimized_std,
+            optimizer.optimized_allocation,
+        ) = optimizer.calculatedResults()
+        return optimizer
+
+    @timed("load.assets")
     def basicMetrics(self):
         if not all(s.isupper() for s in self.stocks):
             raise ValueError("Enter ticker names in Capital Letters!")
         if len(self.stocks) <= 1:
             raise ValueError("More than 1 ticker input required!")
-        try:
-            stockData = yf.download(self.stocks, start=self.start, end=self.end)
-        except:
-            raise ValueError("Unable to download data, try again later!")
-        stockData = stockData["Close"]
+        stockData = self.priceSource.getPrices(self.stocks, self.start, self.end)
 
         if len(stockData.columns) != len(self.stocks):
             raise ValueError("Unable to download data for one or more tickers!")
@@ -47,32 +157,32 @@ class PortfolioOptimizer:
 
         return returns, stdIndividual
 
+    def returnsContext(self):
+        returns, stdIndividual = self.basicMetrics()
+        return ReturnsContext(returns, self.benchmarkReturns())
+
     def portfolioReturnsDaily(self):
-        dailyIndividualReturns, dailyIndividualStd = self.basicMetrics()
-        portfolioDailyReturns = np.dot(
-            dailyIndividualReturns.dropna(), self.optimized_allocation
-        )
-        return portfolioDailyReturns
+        return self.context.portfolioReturns(self.optimized_allocation["allocation"].to_numpy())
 
+    @timed("load.benchmark")
     def benchmarkReturns(self):
-        try:
-            benchmark_data = yf.download("^NSEI", self.start, self.end)
-        except:
+        benchmark_data = self.priceSource.getPrices(["^NSEI"], self.start, self.end)
+        if "^NSEI" not in benchmark_data:
             raise ValueError("Unable to download data, try again later!")
-        benchmark_returns = benchmark_data["Close"].pct_change().dropna()
+        benchmark_returns = benchmark_data["^NSEI"].pct_change().dropna()
         return benchmark_returns
 
     def getData(self):
 
-        returns, stdIndividual = self.basicMetrics()
-        meanReturns = (returns.mean())  
-        covMatrix = (returns.cov())  
+        meanReturns = (self.context.mean())  
+        self.covModel = estimateCovariance(self.context.assetReturns, self.covarianceEstimator)
+        covMatrix = pd.DataFrame(self.covModel.dense(), index=self.context.tickers, columns=self.context.tickers)
 
         return meanReturns, covMatrix
 
     def portfolioPerformance(self, weights):
         returns = (np.sum(self.meanReturns * weights) * 252)  
-        std = np.sqrt(np.dot(weights.T, np.dot(self.covMatrix, weights))) * np.sqrt(252)  
+        std = np.sqrt(self.covModel.variance(np.asarray(weights))) * np.sqrt(252)  
         return returns, std
 
     def sharpe(self, weights):
@@ -80,8 +190,7 @@ class PortfolioOptimizer:
         return (-(pReturns - self.riskFreeRate) / pStd)  
 
     def sortino(self, weights):
-        dailyIndividualReturns, dailyIndividualStd = self.basicMetrics()
-        portfolioDailyReturns = np.dot(dailyIndividualReturns.dropna(), weights)
+        portfolioDailyReturns = self.context.portfolioReturns(weights)
         downsideChanges = portfolioDailyReturns[portfolioDailyReturns < 0]
         downside_deviation = downsideChanges.std(ddof=1) * np.sqrt(252)
         meanReturns = portfolioDailyReturns.mean() * 252
@@ -93,9 +202,8 @@ class PortfolioOptimizer:
         return self.portfolioPerformance(weights)[1]
 
     def trackingError(self, weights):
-        dailyIndividualReturns, dailyIndividualStd = self.basicMetrics()
-        portfolioDailyReturns = np.array(np.dot(dailyIndividualReturns.dropna(), weights))
-        benchmarkReturns = np.array(self.benchmark)
+        portfolioDailyReturns = self.context.portfolioReturns(weights)
+        benchmarkReturns = self.context.benchmarkReturns
 
         difference_array = portfolioDailyReturns - benchmarkReturns
         trackingError = difference_array.std(ddof=1) * np.sqrt(252)
@@ -103,9 +211,8 @@ class PortfolioOptimizer:
         return trackingError
 
     def informationRatio(self, weights):
-        dailyIndividualReturns, dailyIndividualStd = self.basicMetrics()
-        portfolioDailyReturns = np.array(np.dot(dailyIndividualReturns.dropna(), weights))
-        benchmarkReturns = np.array(self.benchmark)
+        portfolioDailyReturns = self.context.portfolioReturns(weights)
+        benchmarkReturns = self.context.benchmarkReturns
         difference_array = portfolioDailyReturns - benchmarkReturns
         portfolioPerformance = portfolioDailyReturns.mean() * 252
         benchmarkPerformance = benchmarkReturns.mean() * 252
@@ -116,98 +223,269 @@ class PortfolioOptimizer:
         return -information
 
     def conditionalVar(self, weights):
-        dailyIndividualReturns, dailyIndividualStd = self.basicMetrics()
-        portfolioDailyReturns = np.array(np.dot(dailyIndividualReturns.dropna(), weights))
+        portfolioDailyReturns = self.context.portfolioReturns(weights)
         mu = portfolioDailyReturns.mean()
         sigma = portfolioDailyReturns.std(ddof=1)
-        var = mu + sigma * norm.ppf(0.95)
+        var = mu + sigma * NormalDist().inv_cdf(0.95)
         loss = portfolioDailyReturns[portfolioDailyReturns < -var]
         cvar = np.mean(loss)
 
         return -cvar
 
-    def optimization_function(self, constraintSet=(0, 1)):
+    ## Analytic gradients. Sortino and CVaR are piecewise smooth: the downside days and the
+    ## tail days are held fixed, which gives the exact gradient almost everywhere.
+    def portfolioReturnGrad(self, weights):
+        return np.asarray(self.meanReturns) * 252
+
+    def portfolioVarianceGrad(self, weights):
+        pStd = self.portfolioVariance(weights)
+        return self.covModel.dot(np.asarray(weights)) * 252 / pStd
+
+    def sharpeGrad(self, weights):
+        pReturns, pStd = self.portfolioPerformance(weights)
+        dReturns = self.portfolioReturnGrad(weights)
+        dStd = self.portfolioVarianceGrad(weights)
+        return -(dReturns * pStd - (pReturns - self.riskFreeRate) * dStd) / pStd**2
+
+    def sortinoGrad(self, weights):
+        X = self.context.assetReturns
+        portfolioDailyReturns = X @ weights
+        downside = portfolioDailyReturns < 0
+        downsideChanges = portfolioDailyReturns[downside]
+        downsideStd = downsideChanges.std(ddof=1)
+        downside_deviation = downsideStd * np.sqrt(252)
+        meanReturns = portfolioDailyReturns.mean() * 252
+
+        dDownside = (
+            (downsideChanges - downsideChanges.mean()) @ X[downside]
+            / ((len(downsideChanges) - 1) * downsideStd)
+            * np.sqrt(252)
+        )
+        dMean = X.mean(axis=0) * 252
+        return -(dMean * downside_deviation - (meanReturns - self.riskFreeRate) * dDownside) / downside_deviation**2
+
+    def trackingErrorGrad(self, weights):
+        X = self.context.assetReturns
+        difference_array = X @ weights - self.context.benchmarkReturns
+        centered = difference_array - difference_array.mean()
+        dailyTrackingError = difference_array.std(ddof=1)
+        return centered @ X / ((len(centered) - 1) * dailyTrackingError) * np.sqrt(252)
+
+    def informationRatioGrad(self, weights):
+        X = self.context.assetReturns
+        benchmarkReturns = self.context.benchmarkReturns
+        portfolioDailyReturns = X @ weights
+        activeReturn = (portfolioDailyReturns.mean() - benchmarkReturns.mean()) * 252
+        trackingError = (portfolioDailyReturns - benchmarkReturns).std(ddof=1) * np.sqrt(252)
+        dActive = X.mean(axis=0) * 252
+        dTracking = self.trackingErrorGrad(weights)
+        return -(dActive * trackingError - activeReturn * dTracking) / trackingError**2
+
+    def conditionalVarGrad(self, weights):
+        X = self.context.assetReturns
+        portfolioDailyReturns = X @ weights
+        mu = portfolioDailyReturns.mean()
+        sigma = portfolioDailyReturns.std(ddof=1)
+        var = mu + sigma * NormalDist().inv_cdf(0.95)
+        return -X[portfolioDailyReturns < -var].mean(axis=0)
+
+    def objectives(self):
+        return {
+            "Maximize Sharpe Ratio": (self.sharpe, self.sharpeGrad),
+            "Minimize Volatility": (self.portfolioVariance, self.portfolioVarianceGrad),
+            "Maximize Sortino Ratio": (self.sortino, self.sortinoGrad),
+            "Minimize Tracking Error": (self.trackingError, self.trackingErrorGrad),
+            "Maximize Information Ratio": (self.informationRatio, self.informationRatioGrad),
+            "Minimize Conditional Value-at-Risk": (self.conditionalVar, self.conditionalVarGrad),
+        }
+
+    def checkGradients(self, weights=None, epsilon=1e-7):
+        ## Relative error between each analytic gradient and a forward-difference estimate
+        numAssets = len(self.meanReturns)
+        if weights is None:
+            weights = np.random.default_rng(self.seed).dirichlet(np.ones(numAssets))
+        errors = {}
+        for criterion, (objective, gradient) in self.objectives().items():
+            analytic = gradient(weights)
+            numeric = sc.approx_fprime(weights, objective, epsilon)
+            errors[criterion] = np.linalg.norm(analytic - numeric) / max(np.linalg.norm(numeric), 1e-12)
+        return pd.Series(errors, name="Relative Error")
+
+    def optimization_function(self, constraintSet=(0, 1), criterion=None, x0=None):
+        criterion = criterion or self.optimization_criterion
 
         numAssets = len(self.meanReturns)  ## gets the number of stocks in the portfolio
         constraints = {
             "type": "eq",
             "fun": lambda x: np.sum(x) - 1,
+            "jac": lambda x: np.ones_like(x),
         }  
         bound = constraintSet  
         bounds = tuple(bound for asset in range(numAssets)) 
 
-        if self.optimization_criterion == "Maximize Sharpe Ratio":
-            return sc.minimize(
-                self.sharpe,
-                numAssets * [1.0 / numAssets],  
-                method="SLSQP",
-                bounds=bounds,
-                constraints=constraints,
-            )
-        elif self.optimization_criterion == "Minimize Volatility":
-            return sc.minimize(
-                self.portfolioVariance,
-                numAssets * [1.0 / numAssets],  
-                method="SLSQP",
-                bounds=bounds,
-                constraints=constraints,
-            )
-        elif self.optimization_criterion == "Maximize Sortino Ratio":
-            return sc.minimize(
-                self.sortino,
-                numAssets * [1.0 / numAssets],  
-                method="SLSQP",
-                bounds=bounds,
-                constraints=constraints,
-            )
-        elif self.optimization_criterion == "Minimize Tracking Error":
-            return sc.minimize(
-                self.trackingError,
-                numAssets * [1.0 / numAssets],  
-                method="SLSQP",
-                bounds=bounds,
-                constraints=constraints,
-            )
-        elif self.optimization_criterion == "Maximize Information Ratio":
-            return sc.minimize(
-                self.informationRatio,
-                numAssets * [1.0 / numAssets],
-                method="SLSQP",
-                bounds=bounds,
-                constraints=constraints,
-            )
-        elif self.optimization_criterion == "Minimize Conditional Value-at-Risk":
-            return sc.minimize(
-                self.conditionalVar,
-                numAssets * [1.0 / numAssets],  
+        if criterion == "Maximize Sharpe Ratio" and tuple(constraintSet) == (0, 1):
+            with solve(criterion) as record:
+                tangent = self.tangencyResult()
+                if tangent is not None:
+                    record["result"] = tangent
+            if tangent is not None:
+                self.solutions[criterion] = tangent["x"]
+                return tangent
+
+        if criterion == "Minimize Conditional Value-at-Risk":
+            with solve(criterion) as record:
+                record["result"] = CVaROptimizer(self.context.assetReturns, constraintSet=constraintSet).solve()
+            self.solutions[criterion] = record["result"]["x"]
+            return record["result"]
+
+        if x0 is None:
+            x0 = self.warmStarts.get(criterion, numAssets * [1.0 / numAssets])
+
+        objective, gradient = self.objectives()[criterion]
+        objective, gradient = CountedCall(objective), CountedCall(gradient)
+        with solve(criterion, objective, gradient) as record:
+            record["result"] = sc.minimize(
+                objective,
+                x0,
                 method="SLSQP",
+                jac=gradient,
                 bounds=bounds,
                 constraints=constraints,
             )
+        self.solutions[criterion] = record["result"]["x"]
+        return record["result"]
+
+    def tangency(self, riskFreeRates=None):
+        ## Maximum Sharpe weights and annualised Sharpe ratios at each rate, read off the
+        ## frontier's corner portfolios; the corner portfolios themselves don't depend on the rate
+        rates = np.atleast_1d(self.riskFreeRate if riskFreeRates is None else riskFreeRates)
+        weights, sharpe = self.frontierEngine.tangency(np.asarray(rates, dtype=np.float64) / 252)
+        return weights, sharpe * np.sqrt(252)
+
+    def tangencyResult(self):
+        ## SLSQP stays in charge for a singular covariance and when no portfolio beats the
+        ## risk-free rate, where the best ratio need not lie on the frontier
+        try:
+            weights, sharpe = self.tangency()
+        except np.linalg.LinAlgError:
+            return None
+        if not sharpe[0] > 0:
+            return None
+        return sc.OptimizeResult(x=weights[0], fun=-sharpe[0], success=True, nit=0)
+
+    def rateSweep(self, riskFreeRates):
+        ## Tangency portfolio at every rate, for rate sensitivity. Rates at or above the best
+        ## attainable return have no tangency portfolio and are left out.
+        weights, sharpe = self.tangency(riskFreeRates)
+        keep = sharpe > 0
+        weights, rates = weights[keep], np.atleast_1d(riskFreeRates)[keep]
+        frame = pd.DataFrame(
+            {
+                "Risk Free Rate (%)": rates * 100,
+                "Return (%)": weights @ self.meanReturns.to_numpy() * 252 * 100,
+                "Volatility (%)": np.sqrt(self.covModel.variances(weights) * 252) * 100,
+                "Sharpe Ratio": sharpe[keep],
+            }
+        )
+        for ticker, column in zip(self.context.tickers, weights.T):
+            frame[ticker.replace(".NS", "")] = column * 100
+        return frame
+
+    def portfolioStats(self, weights):
+        pReturns, pStd = self.portfolioPerformance(weights)
+        portfolioDailyReturns = self.context.portfolioReturns(weights)
+        tail = max(1, int(np.ceil(0.05 * len(portfolioDailyReturns))))
+        worst = np.partition(portfolioDailyReturns, tail - 1)[:tail]
+        return {
+            "Return (%)": round(pReturns * 100, 2),
+            "Volatility (%)": round(pStd * 100, 2),
+            "Sharpe Ratio": round(-self.sharpe(weights), 2),
+            "Sortino Ratio": round(-self.sortino(weights), 2),
+            "Tracking Error": round(self.trackingError(weights), 2),
+            "Information Ratio": round(-self.informationRatio(weights), 2),
+            "CVaR 95% (%)": round(-worst.mean() * 100, 2),
+        }
+
+    def solver(self):
+        ## Copy with only what the solves read, cheap to send to a worker process. The price
+        ## source and shared caches stay behind; a frontier already traced goes along.
+        optimizer = object.__new__(PortfolioOptimizer)
+        for name in ("stocks", "optimization_criterion", "riskFreeRate", "seed", "context", "meanReturns",
+                     "covMatrix", "covModel", "warmStarts"):
+            setattr(optimizer, name, getattr(self, name))
+        optimizer.frontierCache = None
+        optimizer.solutions = {}
+        if "frontierEngine" in self.__dict__:
+            optimizer.__dict__["frontierEngine"] = self.__dict__["frontierEngine"]
+        return optimizer
+
+    def compareCriteria(self, criteria=None, executor=None):
+        ## Every criterion is solved against the same returns context and moments. With
+        ## `executor`, a process pool, the criteria are solved in parallel on copies from
+        ## solver(); threads would not help, as SLSQP's Python callbacks hold the GIL.
+        criteria = criteria or OPTIMIZATION_CRITERIA
+        if executor is None:
+            solves = [self.optimization_function(criterion=c) for c in criteria]
+        else:
+            solver = self.solver()
+            solves = list(executor.map(solveCriterion, [solver] * len(criteria), criteria))
+            self.solutions.update({c: np.asarray(solve["x"]) for c, solve in zip(criteria, solves)})
+
+        rows = []
+        for criterion, solve in zip(criteria, solves):
+            weights = np.asarray(solve["x"])
+            row = {"Objective": criterion}
+            row.update(self.portfolioStats(weights))
+            for ticker, weight in zip(self.context.tickers, weights):
+                row[ticker.replace(".NS", "")] = round(weight * 100, 2)
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+    @timed("cvarFrontier")
+    def cvarFrontier(self, frontierPoints=50, constraintSet=(0, 1)):
+        ## Mean return and historical 95% CVaR of each frontier point, both daily fractions
+        ## like the risk tables (CVaR as a positive loss), with the weights of each point
+        cvarOptimizer = CVaROptimizer(self.context.assetReturns, constraintSet=constraintSet)
+        minimumCVaR = cvarOptimizer.solve()
+        highest = sc.linprog(
+            -cvarOptimizer.meanReturns,
+            A_eq=np.ones((1, cvarOptimizer.numAssets)),
+            b_eq=[1.0],
+            bounds=[constraintSet] * cvarOptimizer.numAssets,
+            method="highs",
+        )
+        targetReturns = np.linspace(
+            minimumCVaR["x"] @ cvarOptimizer.meanReturns, -highest.fun, frontierPoints
+        )
+        weights, cvar = cvarOptimizer.frontier(targetReturns)
+        return targetReturns, cvar, weights
 
     def portfolioReturn(self, weights):  
         return self.portfolioPerformance(weights)[0]
 
-    def efficientOpt(self, returnTarget, constraintSet=(0, 1)):  
+    def efficientOpt(self, returnTarget, constraintSet=(0, 1), x0=None):  
         numAssets = len(self.meanReturns)  
         constraints = (
             {
                 "type": "eq",
                 "fun": lambda x: self.portfolioReturn(x) - returnTarget,
+                "jac": self.portfolioReturnGrad,
             },  
-            {"type": "eq", "fun": lambda x: np.sum(x) - 1},
+            {"type": "eq", "fun": lambda x: np.sum(x) - 1, "jac": lambda x: np.ones_like(x)},
         )  
         bounds = tuple(constraintSet for asset in range(numAssets))  
         effOpt = sc.minimize(
             self.portfolioVariance,
-            numAssets * [1.0 / numAssets],
+            numAssets * [1.0 / numAssets] if x0 is None else x0,
             method="SLSQP",
+            jac=self.portfolioVarianceGrad,
             bounds=bounds,
             constraints=constraints,
         )
 
         return effOpt
 
+    @timed("optimize")
     def calculatedResults(self):
         optimized_portfolio = (self.optimization_function())  
         optimized_returns, optimized_std = self.portfolioPerformance(
@@ -219,19 +497,6 @@ class PortfolioOptimizer:
             columns=["allocation"],
         )  #
 
-        # Efficient Frontier
-        std, ret, shar = self.simulations()
-        efficientList = (
-            []
-        )  
-        targetReturns = np.linspace(
-            min(ret), max(ret), 100
-        )  
-        for target in targetReturns:
-            efficientList.append(
-                self.efficientOpt(target)["fun"]
-            )  
-
         optimized_returns, optimized_std = round(optimized_returns * 100, 2), round(
             optimized_std * 100, 2
         )
@@ -240,42 +505,51 @@ class PortfolioOptimizer:
             optimized_returns,
             optimized_std,
             optimized_allocation,
-            efficientList,
-            targetReturns,
         )
 
+    @timed("frontier")
+    def frontierResults(self, frontierPoints=100):
+        # Efficient Frontier
+        std, ret, shar = self.simulations()
+        targetReturns = np.linspace(
+            min(ret), max(ret), frontierPoints
+        )  
+        try:
+            weights, efficientList = self.frontierEngine.frontier(targetReturns / 252)
+            efficientList = efficientList * np.sqrt(252)
+        except np.linalg.LinAlgError:
+            ## Singular covariance (e.g. duplicated tickers), fall back to one solve per point
+            ## The previous day's frontier, when there is one, starts each point near its answer
+            starts = self.warmFrontier
+            if starts is None or len(starts) != frontierPoints:
+                starts = [None] * frontierPoints
+            solves = [self.efficientOpt(target, x0=x0) for target, x0 in zip(targetReturns, starts)]
+            weights = np.array([solve["x"] for solve in solves])
+            efficientList = np.array([solve["fun"] for solve in solves])
+
+        return list(efficientList), targetReturns, weights
+
+    ## Drawn once so the frontier bounds and the plotted cloud come from the same portfolios
+    @lazyProperty
+    def simulationResults(self):
+        return self.shared("simulations", self.runSimulations)
+
+    @timed("simulations")
+    def runSimulations(self):
+        simulator = PortfolioSimulator(self.meanReturns, self.covModel, seed=self.seed)
+        expectedVolatility, expectedReturn, weights = simulator.run(self.noOfPortfolios)
+        return expectedVolatility, expectedReturn
+
     def simulations(self):  
-        noOfPortfolios = 10000
-        numAssets = len(self.meanReturns)
-        weight = np.zeros((noOfPortfolios, numAssets))
-        expectedReturn = np.zeros(noOfPortfolios)
-        expectedVolatility = np.zeros(noOfPortfolios)
-        sharpeRatio = np.zeros(noOfPortfolios)  
-
-        for k in range(noOfPortfolios):
-            w = np.array(np.random.random(numAssets))  
-            w = w / np.sum(w) 
-            weight[k, :] = w  
-            expectedReturn[k], expectedVolatility[k] = self.portfolioPerformance(weight[k].T)  
-            sharpeRatio[k] = (expectedReturn[k] - self.riskFreeRate) / expectedVolatility[k]  
+        expectedVolatility, expectedReturn = self.simulationResults
+        sharpeRatio = (expectedReturn - self.riskFreeRate) / expectedVolatility  
 
         return expectedVolatility, expectedReturn, sharpeRatio
 
-    def EF_graph(self):
-
-        fig, ax = plt.subplots(figsize=(10, 7))
-
-        # Efficient Frontier
-        ax.plot(
-            [ef_std * 100 for ef_std in self.efficientList],
-            [target * 100 for target in self.targetReturns],
-            color="black",
-            linestyle="-",
-            linewidth=4,
-            label="Efficient Frontier",
-            zorder=1,
-            alpha=0.9,
-        )
+    @timed("plot.frontier")
+    def EF_graph(self, maxPoints=4000):
+        import plotly.graph_objects as go
+        import streamlit as st
 
         if self.optimization_criterion == "Maximize Sharpe Ratio":
             label_v = "Maximum Sharpe Ratio Portfolio"
@@ -290,37 +564,61 @@ class PortfolioOptimizer:
         elif self.optimization_criterion == "Minimize Conditional Value-at-Risk":
             label_v = "Minimum CVaR Portfolio"
 
-        ## Max Sharpe Ratio
-        ax.scatter(
-            [self.optimized_std],
-            [self.optimized_returns],
-            color="orange",
-            marker="o",
-            s=150,
-            label=label_v,
-            edgecolors="darkgray",
-            zorder=4,
+        ## Random Portfolios, thinned on the server so the payload stays bounded
+        expectedVolatility, expectedReturn, sharpeRatio = self.simulations()
+        keep = decimate(expectedVolatility, expectedReturn, maxPoints)
+
+        fig = go.Figure()
+        fig.add_trace(
+            go.Scattergl(
+                x=expectedVolatility[keep] * 100,
+                y=expectedReturn[keep] * 100,
+                mode="markers",
+                marker=dict(
+                    color=sharpeRatio[keep],
+                    colorscale="Blues",
+                    size=6,
+                    colorbar=dict(title="Sharpe Ratio"),
+                ),
+                name="Random Portfolios",
+                hovertemplate="Volatility: %{x:.2f}%<br>Return: %{y:.2f}%<extra></extra>",
+                showlegend=False,
+            )
         )
 
-        ## Plot Random Portfolios
-        expectedVolatility, expectedReturn, sharpeRatio = self.simulations()
-        scatter = ax.scatter(
-            expectedVolatility * 100,
-            expectedReturn * 100,
-            c=sharpeRatio,
-            cmap="Blues",
-            marker="o",
-            zorder=0,
-            s=40,
+        # Efficient Frontier
+        fig.add_trace(
+            go.Scattergl(
+                x=np.asarray(self.efficientList) * 100,
+                y=np.asarray(self.targetReturns) * 100,
+                mode="lines",
+                line=dict(color="black", width=4),
+                name="Efficient Frontier",
+            )
         )
-        plt.colorbar(scatter, ax=ax, label="Sharpe Ratio")
-        ax.set_xlabel("Annualised Volatility (%)")
-        ax.set_ylabel("Annualised Return (%)")
 
-        ax.legend()
-        st.pyplot(fig)
+        fig.add_trace(
+            go.Scattergl(
+                x=[self.optimized_std],
+                y=[self.optimized_returns],
+                mode="markers",
+                marker=dict(color="orange", size=16, line=dict(color="darkgray", width=1)),
+                name=label_v,
+            )
+        )
+
+        fig.update_layout(
+            xaxis_title="Annualised Volatility (%)",
+            yaxis_title="Annualised Return (%)",
+            legend=dict(x=0.01, y=0.99),
+            height=600,
+            margin=dict(l=0, r=0, t=30, b=0),
+        )
+        st.plotly_chart(fig, use_container_width=True)
 
     def allocCharts(self):
+        import plotly.express as px
+
         ## Max Sharpe Ratio allocation
         sharpeChart = px.self.optimized_allocation.allocation()
         fig = px.pie(
@@ -328,15 +626,16 @@ class PortfolioOptimizer:
         )
         return fig.show()
 
+    @timed("frontierStats")
     def frontierStats(self):
         ## Summary Stats
-        returns, std = self.basicMetrics()
+        std = self.context.std()
         tickers = [i for i in self.optimized_allocation.index]
         ExpectedReturn = [f"{round(i*252*100, 2)} %" for i in self.meanReturns]
         StandardDeviation = [f"{round(i*np.sqrt(252)*100, 2)} %" for i in std]
         sharpeRatio = []
         for i, ret in enumerate(self.meanReturns):
-            sharpe = (ret * 252 - self.riskFreeRate) / (std[i] * np.sqrt(252))
+            sharpe = (ret * 252 - self.riskFreeRate) / (std.iloc[i] * np.sqrt(252))
             sharpeRatio.append(round(sharpe, 2))
 
         df = pd.DataFrame(
@@ -350,7 +649,7 @@ class PortfolioOptimizer:
 
         ## Correlation Matrix
 
-        matrix = returns.corr().round(decimals=2)
+        matrix = self.context.corr().round(decimals=2)
         matrix[""] = matrix.index
         matrix = matrix[[""] + [col for col in matrix.columns if col != ""]]
         matrix.columns = [stock.replace(".NS", "") for stock in matrix.columns]
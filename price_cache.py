@@ -0,0 +1,284 @@
+import os
+import re
+import json
+import time
+import threading
+import datetime as dt
+from contextlib import contextmanager
+import pandas as pd
+from instrumentation import span, count
+
+try:
+    import fcntl
+except ImportError:
+    ## No advisory file locks (Windows): only threads of one process are serialized
+    fcntl = None
+
+
+class PriceCache:
+    ## Close prices are stored as one Parquet file per ticker. index.json records the
+    ## [start, end) range already requested from Yahoo for each ticker, so holidays and
+    ## weekends inside a covered range are never re-downloaded. Several processes may share a
+    ## directory: every read-modify-write of the store holds a lock file, and files are
+    ## written under a per-process temporary name and renamed into place.
+
+    def __init__(
+        self,
+        directory=None,
+        maxAge=7 * 24 * 3600,
+        maxBytes=512 * 1024 * 1024,
+        refreshInterval=3600,
+    ):
+        self.directory = directory or os.environ.get(
+            "PRICE_CACHE_DIR", os.path.join(".cache", "prices")
+        )
+        self.maxAge = maxAge
+        self.maxBytes = maxBytes
+        self.refreshInterval = refreshInterval
+        self.lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self.indexPath = os.path.join(self.directory, "index.json")
+        self.lockPath = os.path.join(self.directory, ".lock")
+        self.index = self.loadIndex()
+
+    @contextmanager
+    def locked(self):
+        ## The index is re-read under the lock, since another process may have changed it
+        with self.lock, open(self.lockPath, "a") as handle:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                self.index = self.loadIndex()
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def temporaryPath(self, path):
+        return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+    def loadIndex(self):
+        try:
+            with open(self.indexPath) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def saveIndex(self):
+        tmp = self.temporaryPath(self.indexPath)
+        with open(tmp, "w") as f:
+            json.dump(self.index, f)
+        os.replace(tmp, self.indexPath)
+
+    def tickerPath(self, ticker):
+        return os.path.join(self.directory, re.sub(r"[^A-Za-z0-9.^_-]", "_", ticker) + ".parquet")
+
+    def missingRanges(self, ticker, start, end):
+        entry = self.index.get(ticker)
+        if entry is None:
+            return [(start, end)]
+
+        cachedStart = pd.Timestamp(entry["start"])
+        cachedEnd = pd.Timestamp(entry["end"])
+        today = pd.Timestamp(dt.date.today())
+        ## Bars for the current session are still moving, refetch them once they go stale
+        if cachedEnd > today and time.time() - entry["fetched"] > self.refreshInterval:
+            cachedEnd = today
+
+        ## Gaps always touch the cached range so coverage stays one contiguous interval
+        gaps = []
+        if start < cachedStart:
+            gaps.append((start, cachedStart))
+        if end > cachedEnd:
+            gaps.append((cachedEnd, end))
+        return gaps
+
+    def readTicker(self, ticker):
+        path = self.tickerPath(ticker)
+        if not os.path.exists(path):
+            return pd.Series(dtype="float64", name=ticker)
+        return pd.read_parquet(path)["Close"].rename(ticker)
+
+    def writeTicker(self, ticker, series):
+        series.index.name = "Date"
+        path = self.tickerPath(ticker)
+        tmp = self.temporaryPath(path)
+        series.rename("Close").to_frame().to_parquet(tmp)
+        os.replace(tmp, path)
+
+    def download(self, tickers, start, end):
+        import yfinance as yf
+
+        try:
+            data = yf.download(tickers, start=start, end=end, progress=False)
+        except Exception:
+            raise ValueError("Unable to download data, try again later!")
+        if data is None or data.empty:
+            return pd.DataFrame(columns=tickers, dtype="float64")
+
+        close = data["Close"]
+        if isinstance(close, pd.Series):
+            close = close.to_frame(name=tickers[0])
+        close.index = pd.DatetimeIndex(close.index).tz_localize(None).normalize()
+        return close.reindex(columns=tickers)
+
+    def getPrices(self, tickers, start, end):
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        prices, replaced = self.fillAndRead(tickers, start, end)
+        if replaced:
+            ## Another caller evicted or rebuilt a requested ticker during the download. Under
+            ## heavy eviction that can repeat, so the retry holds the lock throughout.
+            prices, _ = self.fillAndRead(tickers, start, end, exclusive=True)
+        return prices
+
+    def fillAndRead(self, tickers, start, end, exclusive=False):
+        ## Unless `exclusive`, the lock is held to plan the downloads and to merge them but not
+        ## across the network, so warm reads from other callers don't wait behind a cold download
+        with self.locked():
+            requests, basis = self.planGaps(tickers, start, end)
+            if exclusive:
+                return self.mergeAndRead(tickers, start, end, requests, self.downloadGaps(requests), basis)
+            if requests:
+                self.saveIndex()
+        downloads = self.downloadGaps(requests)
+        with self.locked():
+            return self.mergeAndRead(tickers, start, end, requests, downloads, basis)
+
+    def planGaps(self, tickers, start, end):
+        self.evictExpired()
+
+        ## Group tickers by identical gaps so each distinct range is one request
+        requests = {}
+        for ticker in tickers:
+            gaps = self.missingRanges(ticker, start, end)
+            count("priceCache.miss" if gaps else "priceCache.hit")
+            for gap in gaps:
+                requests.setdefault(gap, []).append(ticker)
+        ## The stored segment each ticker had, to detect replacements while unlocked
+        basis = {ticker: self.index.get(ticker, {}).get("created") for ticker in tickers}
+        return requests, basis
+
+    def downloadGaps(self, requests):
+        downloads = {}
+        for (gapStart, gapEnd), group in requests.items():
+            with span("download", tickers=len(group)):
+                downloads[gapStart, gapEnd] = self.download(group, gapStart, gapEnd)
+        return downloads
+
+    def mergeAndRead(self, tickers, start, end, requests, downloads, basis):
+        now = time.time()
+        ## Any requested ticker, cached or not, may have been evicted or rebuilt meanwhile
+        replaced = any(self.index.get(ticker, {}).get("created") != basis[ticker] for ticker in tickers)
+        for (gapStart, gapEnd), group in requests.items():
+            fetched = downloads[gapStart, gapEnd]
+            ## A gap where no ticker traded (a holiday) is covered; a ticker that came back
+            ## empty while others returned rows failed and is fetched again next time
+            groupReturned = bool(fetched.notna().any().any())
+            for ticker in group:
+                entry = self.index.get(ticker)
+                if (entry or {}).get("created") != basis[ticker]:
+                    continue
+                if not any(s < gapEnd and gapStart < e for s, e in self.missingRanges(ticker, start, end)):
+                    ## Another caller already filled this gap
+                    continue
+                new = fetched[ticker].dropna() if ticker in fetched else pd.Series(dtype="float64")
+                if new.empty and groupReturned:
+                    continue
+                old = self.readTicker(ticker)
+                if new.empty and old.empty:
+                    ## Nothing known about this ticker, don't record it as covered
+                    continue
+                merged = pd.concat([old, new])
+                merged = merged[~merged.index.duplicated(keep="last")].sort_index()
+                self.writeTicker(ticker, merged)
+
+                if entry is None:
+                    ## `created` dates the oldest stored segment; later gaps are appended
+                    ## on its adjustment basis, so expiry counts from it, not the last fill
+                    entry = {"start": gapStart.isoformat(), "end": gapEnd.isoformat(), "created": now}
+                else:
+                    entry["start"] = min(pd.Timestamp(entry["start"]), gapStart).isoformat()
+                    entry["end"] = max(pd.Timestamp(entry["end"]), gapEnd).isoformat()
+                entry["fetched"] = now
+                self.index[ticker] = entry
+
+        columns = {}
+        for ticker in tickers:
+            if ticker not in self.index:
+                continue
+            series = self.readTicker(ticker)
+            columns[ticker] = series[(series.index >= start) & (series.index < end)]
+            self.index[ticker]["used"] = now
+
+        self.evictOversized(keep=set(tickers))
+        self.saveIndex()
+
+        prices = pd.DataFrame(columns)
+        prices.index.name = "Date"
+        return prices, replaced
+
+    def evictExpired(self):
+        ## Expired tickers are dropped entirely so splits and dividend adjustments get picked up
+        now = time.time()
+        for ticker in list(self.index):
+            entry = self.index[ticker]
+            if now - entry.get("created", entry["fetched"]) > self.maxAge:
+                self.remove(ticker)
+
+    def evictOversized(self, keep=()):
+        sizes = {
+            ticker: os.path.getsize(self.tickerPath(ticker))
+            for ticker in self.index
+            if os.path.exists(self.tickerPath(ticker))
+        }
+        total = sum(sizes.values())
+        ## Least recently used tickers go first once the store outgrows its budget
+        for ticker in sorted(sizes, key=lambda t: self.index[t].get("used", 0)):
+            if total <= self.maxBytes:
+                break
+            if ticker in keep:
+                continue
+            total -= sizes[ticker]
+            self.remove(ticker)
+
+    def remove(self, ticker):
+        self.index.pop(ticker, None)
+        try:
+            os.remove(self.tickerPath(ticker))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        with self.locked():
+            for ticker in list(self.index):
+                self.remove(ticker)
+            self.saveIndex()
+
+
+_defaultCache = None
+
+
+def defaultPriceCache():
+    global _defaultCache
+    if _defaultCache is None:
+        _defaultCache = PriceCache()
+    return _defaultCache
+
+
+class PricePanel:
+    ## Close prices already held in memory (dates x tickers). Serves the same getPrices
+    ## interface as PriceCache, so many optimizers can share one loaded panel.
+
+    def __init__(self, prices):
+        self.prices = prices.sort_index()
+
+    @classmethod
+    def load(cls, tickers, start, end, priceSource=None):
+        priceSource = priceSource if priceSource is not None else defaultPriceCache()
+        return cls(priceSource.getPrices(list(tickers), start, end))
+
+    def getPrices(self, tickers, start, end):
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        available = [ticker for ticker in tickers if ticker in self.prices.columns]
+        rows = (self.prices.index >= start) & (self.prices.index < end)
+        return self.prices.loc[rows, available].dropna(how="all")
@@ -0,0 +1,95 @@
+import sys
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from instrumentation import count
+
+
+class ResultCache:
+    ## Process-wide cache of finished results, shared by every dashboard session.
+    ## Entries expire after `ttl` seconds and the least recently used ones are dropped once
+    ## their estimated size passes `maxBytes`. Identical requests arriving while a result is
+    ## being computed wait for that computation instead of starting their own.
+
+    def __init__(self, ttl=900, maxBytes=256 * 1024 * 1024, sizeOf=None):
+        self.ttl = ttl
+        self.maxBytes = maxBytes
+        self.sizeOf = sizeOf or defaultSizeOf
+        self.entries = OrderedDict()
+        self.pending = {}
+        self.totalBytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, compute):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, size, expires = entry
+                if expires > time.monotonic():
+                    self.entries.move_to_end(key)
+                    count("resultCache.hit")
+                    return value
+                self.discard(key)
+
+            future = self.pending.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self.pending[key] = future
+
+        if not owner:
+            count("resultCache.coalesced")
+            return future.result()
+
+        count("resultCache.miss")
+        try:
+            value = compute()
+        except BaseException as e:
+            with self.lock:
+                del self.pending[key]
+            future.set_exception(e)
+            raise
+
+        size = self.sizeOf(value)
+        with self.lock:
+            del self.pending[key]
+            if size <= self.maxBytes:
+                self.entries[key] = (value, size, time.monotonic() + self.ttl)
+                self.totalBytes += size
+                while self.totalBytes > self.maxBytes:
+                    self.discard(next(iter(self.entries)))
+        future.set_result(value)
+        return value
+
+    def resize(self, key):
+        ## Measures an entry again after its value has grown in place, e.g. a session whose
+        ## stages finished in the background after it was stored
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return
+            value, size, expires = entry
+            newSize = self.sizeOf(value)
+            self.entries[key] = (value, newSize, expires)
+            self.totalBytes += newSize - size
+            while self.totalBytes > self.maxBytes:
+                self.discard(next(iter(self.entries)))
+
+    def discard(self, key):
+        value, size, expires = self.entries.pop(key)
+        self.totalBytes -= size
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.totalBytes = 0
+
+
+def defaultSizeOf(value):
+    if isinstance(value, (tuple, list)):
+        return sum(defaultSizeOf(item) for item in value)
+    nbytes = getattr(value, "nbytes", None)
+    if callable(nbytes):
+        return nbytes()
+    return nbytes if nbytes is not None else sys.getsizeof(value)
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+
+
+class ReturnsContext:
+    ## Daily asset returns and benchmark returns on real trading dates. `calendar` holds every
+    ## date any series traded and `mask` marks the dates on which all of them did; only those
+    ## rows are kept, once, so everything downstream works on the same aligned, NaN-free
+    ## float64 arrays and never realigns by position.
+
+    def __init__(self, returns, benchmark):
+        tickers = list(returns.columns)
+        calendar, mask, assetReturns, benchmarkReturns = align(returns, benchmark)
+        self.setArrays(tickers, calendar, mask, assetReturns, benchmarkReturns, benchmark.name)
+
+    def setArrays(self, tickers, calendar, mask, assetReturns, benchmarkReturns, benchmarkName):
+        self.tickers = tickers
+        self.calendar = calendar
+        self.mask = mask
+        self.dates = calendar[mask]
+        self.assetReturns = np.ascontiguousarray(assetReturns)
+        self.benchmarkReturns = np.ascontiguousarray(benchmarkReturns)
+        self.returns = pd.DataFrame(self.assetReturns, index=self.dates, columns=self.tickers)
+        self.benchmark = pd.Series(self.benchmarkReturns, index=self.dates, name=benchmarkName)
+
+        if len(self.dates) < 2:
+            raise ValueError("Not enough overlapping data for the selected dates!")
+
+    def advance(self, returns, benchmark, slide=False):
+        ## New context with later rows appended, aligned exactly as in the constructor. With
+        ## `slide` as many of the oldest rows are dropped, keeping the window length fixed.
+        calendar, mask, assetReturns, benchmarkReturns = align(returns[self.tickers], benchmark)
+        drop = int(mask.sum()) if slide else 0
+        if drop >= len(self.assetReturns) - 1:
+            raise ValueError("Not enough overlapping data for the selected dates!")
+        ## Calendar days up to the last dropped row go with it
+        cut = np.flatnonzero(self.mask)[drop - 1] + 1 if drop else 0
+        context = object.__new__(ReturnsContext)
+        context.setArrays(
+            self.tickers,
+            self.calendar[cut:].append(calendar),
+            np.concatenate([self.mask[cut:], mask]),
+            np.concatenate([self.assetReturns[drop:], assetReturns]),
+            np.concatenate([self.benchmarkReturns[drop:], benchmarkReturns]),
+            self.benchmark.name,
+        )
+        return context
+
+    def portfolioReturns(self, weights):
+        return self.assetReturns @ weights
+
+    def portfolioSeries(self, weights):
+        return pd.Series(self.portfolioReturns(weights), index=self.dates, name="Portfolio")
+
+    def excludedDates(self):
+        ## Trading dates dropped because some ticker or the benchmark has no return on them
+        return self.calendar[~self.mask]
+
+    def mean(self):
+        return pd.Series(self.assetReturns.mean(axis=0), index=self.tickers)
+
+    def cov(self):
+        return pd.DataFrame(np.cov(self.assetReturns, rowvar=False), index=self.tickers, columns=self.tickers)
+
+    def std(self):
+        return pd.Series(self.assetReturns.std(axis=0, ddof=1), index=self.tickers)
+
+    def corr(self):
+        return pd.DataFrame(np.corrcoef(self.assetReturns, rowvar=False), index=self.tickers, columns=self.tickers)
+
+
+def align(returns, benchmark):
+    ## Calendar is every date on which any asset or the benchmark has a return; the mask keeps
+    ## the rows where all of them do
+    calendar = returns.index.union(benchmark.index)
+    assetReturns = returns.reindex(calendar).to_numpy(dtype=np.float64)
+    benchmarkReturns = benchmark.reindex(calendar).to_numpy(dtype=np.float64)
+    assetValid = np.isfinite(assetReturns)
+    benchmarkValid = np.isfinite(benchmarkReturns)
+    traded = assetValid.any(axis=1) | benchmarkValid
+    mask = (assetValid.all(axis=1) & benchmarkValid)[traded]
+    return calendar[traded], mask, assetReturns[traded][mask], benchmarkReturns[traded][mask]
@@ -1,16 +1,22 @@
-from portfolio_optimizer import PortfolioOptimizer
 import numpy as np
-from scipy.stats import norm
 import pandas as pd
-import plotly.express as px
-import streamlit as st
+from risk_engine import RiskEngine
+from instrumentation import timed
 
 
-class RiskMetrics(PortfolioOptimizer):
-    def __init__(self, stocks, start, end, optimization_criterion, riskFreeRate=0.07024):
-        super().__init__(stocks, start, end, optimization_criterion, riskFreeRate)
-        self.portfolioDaily = np.array(self.portfolioReturnsDaily())
+class RiskMetrics:
+    CONFIDENCE_LEVELS = np.array([0.9, 0.95, 0.99])
+
+    def __init__(self, optimizer):
+        self.optimizer = optimizer
+        self.portfolioDaily = optimizer.portfolioReturnsDaily()
         self.mu, self.sigma = self.muSigma()
+        self.engine = RiskEngine(
+            self.portfolioDaily,
+            optimizer.context.assetReturns,
+            optimizer.optimized_allocation["allocation"].to_numpy(),
+            seed=optimizer.seed,
+        )
 
     def muSigma(self):
         mu = self.portfolioDaily.mean()
@@ -19,24 +25,26 @@ class RiskMetrics(PortfolioOptimizer):
         return mu, sigma
 
     def Rvar(self):
-        confidence_levels = [0.9, 0.95, 0.99]
-        var_values = []
-        for lvl in confidence_levels:
-            var = self.mu + self.sigma * norm.ppf(lvl)
-            var_values.append(var)
-
-        return var_values
+        ## Parametric (normal) one-day VaR at each confidence level
+        var, cvar = self.engine.parametric(self.CONFIDENCE_LEVELS)
+        return list(var[0])
 
     def RCvar(self):
-        var_values = self.Rvar()
-        cvar_values = []
-        for var in var_values:
-            loss = self.portfolioDaily[self.portfolioDaily < -var]
-            cvar = np.mean(loss)
-            cvar_values.append(-cvar)
-
-        return cvar_values
-
+        ## Realised mean loss on the days beyond each VaR, from one sort of the returns
+        ordered = np.sort(self.portfolioDaily)
+        tail = np.maximum(1, np.searchsorted(ordered, -np.array(self.Rvar())))
+        return list(-np.cumsum(ordered)[tail - 1] / tail)
+
+    @timed("riskEngine")
+    def riskEngineTable(self, horizons=(1, 10), scenarios=20000):
+        ## Every method at the dashboard's confidence levels, in percent for display
+        table = self.engine.table(self.CONFIDENCE_LEVELS, horizons, scenarios=scenarios)
+        table["Confidence"] = [f"{round(level * 100)}%" for level in table["Confidence"]]
+        columns = ["VaR", "CVaR", "VaR CI Low", "VaR CI High", "CVaR CI Low", "CVaR CI High"]
+        table[columns] = (table[columns] * 100).round(2)
+        return table.rename(columns={column: f"{column} (%)" for column in columns})
+
+    @timed("riskTable")
     def riskTable(self):
         var_values = self.Rvar()
         cvar_values = self.RCvar()
@@ -65,19 +73,12 @@ class RiskMetrics(PortfolioOptimizer):
 
         return var_df
 
+    @timed("plot.var")
     def varXReturns(self):
-        portfolio = np.array(self.portfolioDaily).flatten()
-        ret, std = self.basicMetrics()
-        portfolio_dates = ret.index
-
-        if len(portfolio) == len(portfolio_dates):
-            portfolio_series = pd.Series(portfolio, index=portfolio_dates)
-        else:
-            # Handle length mismatch: truncate or pad the shorter array
-            min_length = min(len(portfolio), len(portfolio_dates))
-            portfolio_series = pd.Series(
-                portfolio[:min_length], index=portfolio_dates[:min_length]
-            )
+        import streamlit as st
+        import plotly.express as px
+
+        portfolio_series = pd.Series(self.portfolioDaily, index=self.optimizer.context.dates)
 
         daily_returns_df = pd.DataFrame(
             {
@@ -0,0 +1,203 @@
+import numpy as np
+import pandas as pd
+from scipy.special import ndtri
+
+
+RISK_METHODS = ["Historical", "Parametric", "Cornish-Fisher", "Monte Carlo"]
+
+
+def tailStatistics(sortedReturns, levels):
+    ## VaR and CVaR at every level from one ascending sort: the k worst outcomes form the
+    ## tail, VaR is the loss at the k-th and CVaR the mean loss over all k
+    n = sortedReturns.shape[-1]
+    k = np.maximum(1, np.ceil((1 - levels) * n).astype(int))
+    worst = np.cumsum(sortedReturns, axis=-1)
+    var = -sortedReturns[..., k - 1]
+    cvar = -worst[..., k - 1] / k
+    return var, cvar
+
+
+def normalPdf(z):
+    return np.exp(-0.5 * z**2) / np.sqrt(2 * np.pi)
+
+
+class RiskEngine:
+    ## Value-at-Risk and CVaR of a portfolio at any vector of confidence levels and horizons.
+    ## Results are positive losses as fractions of portfolio value, indexed [horizon, level].
+    ## Historical uses overlapping h-day compounded returns, the parametric and Cornish-Fisher
+    ## forms scale the daily moments as for i.i.d. returns, and Monte Carlo simulates
+    ## correlated asset paths so buy-and-hold compounding across assets is captured.
+
+    def __init__(self, portfolioReturns, assetReturns=None, weights=None, seed=None, memoryBudget=64 * 1024 * 1024):
+        self.portfolioReturns = np.asarray(portfolioReturns, dtype=np.float64).ravel()
+        self.assetReturns = None if assetReturns is None else np.asarray(assetReturns, dtype=np.float64)
+        self.weights = None if weights is None else np.asarray(weights, dtype=np.float64).ravel()
+        self.seed = seed
+        self.memoryBudget = memoryBudget
+
+        r = self.portfolioReturns
+        self.mu = r.mean()
+        self.sigma = r.std(ddof=1)
+        centered = (r - self.mu) / r.std()
+        self.skewness = np.mean(centered**3)
+        self.excessKurtosis = np.mean(centered**4) - 3
+
+    def horizonReturns(self, horizon):
+        ## Overlapping compounded returns over `horizon` days from one cumulative log sum.
+        ## Empty when the history is not longer than the horizon.
+        if horizon == 1:
+            return self.portfolioReturns
+        growth = np.concatenate([[0.0], np.cumsum(np.log1p(self.portfolioReturns))])
+        return np.expm1(growth[horizon:] - growth[:-horizon])
+
+    def historical(self, levels, horizons=(1,)):
+        ## Horizons with no full window in the history are NaN rather than an error
+        levels = np.asarray(levels, dtype=np.float64)
+        var = np.full((len(horizons), len(levels)), np.nan)
+        cvar = np.full((len(horizons), len(levels)), np.nan)
+        for i, horizon in enumerate(horizons):
+            windows = self.horizonReturns(horizon)
+            if len(windows):
+                var[i], cvar[i] = tailStatistics(np.sort(windows), levels)
+        return var, cvar
+
+    def parametric(self, levels, horizons=(1,)):
+        levels = np.asarray(levels, dtype=np.float64)
+        horizons = np.asarray(horizons, dtype=np.float64)[:, None]
+        z = ndtri(levels)
+        mean, scale = self.mu * horizons, self.sigma * np.sqrt(horizons)
+        var = scale * z - mean
+        cvar = scale * normalPdf(z) / (1 - levels) - mean
+        return var, cvar
+
+    def cornishFisherQuantile(self, p, horizons):
+        ## Skewness shrinks with sqrt(h) and excess kurtosis with h under aggregation
+        z = ndtri(p)
+        skew = self.skewness / np.sqrt(horizons)
+        kurt = self.excessKurtosis / horizons
+        return (
+            z
+            + (z**2 - 1) * skew / 6
+            + (z**3 - 3 * z) * kurt / 24
+            - (2 * z**3 - 5 * z) * skew**2 / 36
+        )
+
+    def cornishFisher(self, levels, horizons=(1,), gridPoints=256):
+        levels = np.asarray(levels, dtype=np.float64)
+        horizons = np.asarray(horizons, dtype=np.float64)[:, None, None]
+        mean, scale = self.mu * horizons[..., 0], self.sigma * np.sqrt(horizons[..., 0])
+        tail = 1 - levels
+
+        var = -(mean + scale * self.cornishFisherQuantile(tail, horizons[..., 0]))
+        ## CVaR averages the expansion's quantile over the tail on a midpoint grid
+        grid = (np.arange(gridPoints) + 0.5) / gridPoints
+        quantiles = self.cornishFisherQuantile(tail[:, None] * grid, horizons)
+        cvar = -(mean + scale * quantiles.mean(axis=-1))
+        return var, cvar
+
+    def simulate(self, horizons, scenarios):
+        ## Buy-and-hold portfolio returns at each horizon, shape (len(horizons), scenarios).
+        ## Daily asset returns are multivariate normal with the sample mean and covariance.
+        ## Each batch compounds its asset values one day at a time in place and records the
+        ## portfolio only on the requested horizons, so a batch holds scenarios x assets
+        ## rather than every day's path; batches are sized to the memory budget.
+        if self.assetReturns is None or self.weights is None:
+            raise ValueError("Monte Carlo risk needs the asset returns and weights!")
+        mean = self.assetReturns.mean(axis=0)
+        cov = np.atleast_2d(np.cov(self.assetReturns, rowvar=False))
+        values, vectors = np.linalg.eigh(cov)
+        factor = (vectors * np.sqrt(np.clip(values, 0, None))).T
+
+        horizons = np.asarray(horizons)
+        steps, numAssets = int(horizons.max()), len(mean)
+        batch = max(1, self.memoryBudget // (8 * numAssets * 3))
+        rng = np.random.default_rng(self.seed)
+
+        outcomes = np.empty((len(horizons), scenarios))
+        for lo in range(0, scenarios, batch):
+            hi = min(scenarios, lo + batch)
+            growth = np.ones((hi - lo, numAssets))
+            normals = np.empty((hi - lo, numAssets))
+            for day in range(1, steps + 1):
+                rng.standard_normal(out=normals)
+                daily = normals @ factor
+                daily += 1 + mean
+                growth *= daily
+                for i in np.flatnonzero(horizons == day):
+                    outcomes[i, lo:hi] = growth @ self.weights - 1
+        return outcomes
+
+    def bootstrap(self, sortedReturns, levels, resamples, confidence, rng, chunk=32):
+        ## Percentile intervals for VaR and CVaR. Each resample is kept as counts over the
+        ## already sorted outcomes, so no resample needs its own sort. Only the worst `head`
+        ## outcomes can enter a tail: how many of a resample's n draws land there is binomial,
+        ## and those draws are uniform over the head, so each resample costs O(head), not O(n).
+        n = len(sortedReturns)
+        k = np.maximum(1, np.ceil((1 - levels) * n).astype(int))
+        head = min(n, 2 * int(k.max()) + 64)
+        var = np.empty((resamples, len(levels)))
+        cvar = np.empty((resamples, len(levels)))
+        for lo in range(0, resamples, chunk):
+            rows = np.arange(min(resamples, lo + chunk) - lo)
+            sizes = rng.binomial(n, head / n, size=len(rows))
+            if sizes.min() < k.max():
+                ## Practically unreachable; resample this chunk in full rather than truncate a tail
+                head, sizes = n, np.full(len(rows), n)
+            draws = rng.integers(0, head, sizes.sum()) + head * np.repeat(rows, sizes)
+            counts = np.bincount(draws, minlength=len(rows) * head).reshape(len(rows), head)
+            cumulative = np.cumsum(counts, axis=1)
+            weighted = np.cumsum(counts * sortedReturns[:head], axis=1)
+            for j, kj in enumerate(k):
+                ## Position of the kj-th worst draw, and the share of its count inside the tail
+                position = (cumulative >= kj).argmax(axis=1)
+                tailSum = weighted[rows, position] - (cumulative[rows, position] - kj) * sortedReturns[position]
+                var[lo + rows, j] = -sortedReturns[position]
+                cvar[lo + rows, j] = -tailSum / kj
+        bounds = [(1 - confidence) / 2 * 100, (1 + confidence) / 2 * 100]
+        return np.percentile(var, bounds, axis=0).T, np.percentile(cvar, bounds, axis=0).T
+
+    def monteCarlo(self, levels, horizons=(1,), scenarios=100000, resamples=200, confidence=0.95):
+        ## Returns VaR, CVaR and their bootstrap intervals, the latter shaped [horizon, level, 2]
+        levels = np.asarray(levels, dtype=np.float64)
+        outcomes = np.sort(self.simulate(horizons, scenarios), axis=1)
+        var, cvar = tailStatistics(outcomes, levels)
+        rng = np.random.default_rng(None if self.seed is None else self.seed + 1)
+        intervals = [self.bootstrap(row, levels, resamples, confidence, rng) for row in outcomes]
+        return var, cvar, np.array([i[0] for i in intervals]), np.array([i[1] for i in intervals])
+
+    def table(self, levels=(0.9, 0.95, 0.99), horizons=(1, 10), methods=None, **monteCarloOptions):
+        ## Long-form results of every method, one row per method, horizon and level
+        methods = methods or RISK_METHODS
+        rows = []
+        for method in methods:
+            intervals = None
+            if method == "Historical":
+                var, cvar = self.historical(levels, horizons)
+            elif method == "Parametric":
+                var, cvar = self.parametric(levels, horizons)
+            elif method == "Cornish-Fisher":
+                var, cvar = self.cornishFisher(levels, horizons)
+            elif method == "Monte Carlo":
+                var, cvar, varCI, cvarCI = self.monteCarlo(levels, horizons, **monteCarloOptions)
+                intervals = (varCI, cvarCI)
+            else:
+                raise ValueError(f"Unknown risk method: {method}")
+
+            for i, horizon in enumerate(horizons):
+                for j, level in enumerate(levels):
+                    row = {
+                        "Method": method,
+                        "Horizon (days)": horizon,
+                        "Confidence": level,
+                        "VaR": var[i, j],
+                        "CVaR": cvar[i, j],
+                        "VaR CI Low": np.nan,
+                        "VaR CI High": np.nan,
+                        "CVaR CI Low": np.nan,
+                        "CVaR CI High": np.nan,
+                    }
+                    if intervals is not None:
+                        row["VaR CI Low"], row["VaR CI High"] = intervals[0][i, j]
+                        row["CVaR CI Low"], row["CVaR CI High"] = intervals[1][i, j]
+                    rows.append(row)
+        return pd.DataFrame(rows)
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+
+
+def windowSums(values, length):
+    ## Sum of every trailing window of `length` rows from one cumulative sum, O(n) in total
+    cumulative = np.concatenate([[0.0], np.cumsum(values)])
+    sums = np.full(len(values), np.nan)
+    sums[length - 1:] = cumulative[length:] - cumulative[:-length]
+    return sums
+
+
+class RollingAnalytics:
+    ## Trailing-window statistics of the portfolio's daily returns. Each statistic is built
+    ## from running sums of the returns, their squares and cross products, so every window
+    ## length costs O(n) regardless of its size. Series are centred on their full-sample
+    ## means first, which keeps the sum-of-squares form of the variance accurate.
+
+    COLUMNS = ["Volatility (%)", "Sharpe Ratio", "Sortino Ratio", "Beta", "Tracking Error", "Drawdown (%)"]
+
+    def __init__(self, portfolio, benchmark, dates, riskFreeRate):
+        self.portfolio = np.asarray(portfolio, dtype=np.float64).ravel()
+        self.benchmark = np.asarray(benchmark, dtype=np.float64).ravel()
+        self.dates = pd.DatetimeIndex(dates)
+        self.riskFreeRate = riskFreeRate
+
+    def variance(self, centered, length):
+        ## Sample variance of each window from the sums of a centred series
+        sums = windowSums(centered, length)
+        squares = windowSums(centered**2, length)
+        return np.maximum(squares - sums**2 / length, 0.0) / (length - 1)
+
+    def window(self, length):
+        if length < 2:
+            raise ValueError("Rolling windows need at least 2 observations!")
+        p = self.portfolio - self.portfolio.mean()
+        b = self.benchmark - self.benchmark.mean()
+        active = self.portfolio - self.benchmark
+        active = active - active.mean()
+
+        mean = windowSums(self.portfolio, length) / length
+        volatility = np.sqrt(self.variance(p, length) * 252)
+
+        ## Downside deviation is the sample deviation of the negative days in the window
+        negative = self.portfolio < 0
+        downsideCount = windowSums(negative.astype(np.float64), length)
+        downsideSum = windowSums(np.where(negative, self.portfolio, 0.0), length)
+        downsideSquares = windowSums(np.where(negative, self.portfolio**2, 0.0), length)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            downside = np.sqrt(
+                np.maximum(downsideSquares - downsideSum**2 / downsideCount, 0.0) / (downsideCount - 1) * 252
+            )
+            downside[downsideCount < 2] = np.nan
+
+            covariance = (windowSums(p * b, length) - windowSums(p, length) * windowSums(b, length) / length) / (
+                length - 1
+            )
+            beta = covariance / self.variance(b, length)
+            excess = mean * 252 - self.riskFreeRate
+            sharpe = excess / volatility
+            sortino = excess / downside
+        trackingError = np.sqrt(self.variance(active, length) * 252)
+
+        ## Drawdown from the highest wealth reached within the window, including its start
+        wealth = np.concatenate([[1.0], np.cumprod(1 + self.portfolio)])
+        peak = pd.Series(wealth).rolling(length + 1, min_periods=1).max().to_numpy()[1:]
+        drawdown = wealth[1:] / peak - 1
+        drawdown[: length - 1] = np.nan
+
+        return pd.DataFrame(
+            np.column_stack([volatility * 100, sharpe, sortino, beta, trackingError, drawdown * 100]),
+            index=self.dates,
+            columns=self.COLUMNS,
+        )
+
+    def frames(self, windows=(21, 63, 252)):
+        ## One frame per window length, all on the full date index so they overlay directly
+        return {length: self.window(length) for length in windows if length <= len(self.portfolio)}
+
+    def long(self, windows=(21, 63, 252)):
+        ## Stacked form for plotting: Date, Window, then one column per statistic
+        frames = self.frames(windows)
+        if not frames:
+            return pd.DataFrame(columns=["Date", "Window"] + self.COLUMNS)
+        stacked = pd.concat(
+            [frame.assign(Window=f"{length}d") for length, frame in frames.items()]
+        )
+        stacked.index.name = "Date"
+        return stacked.reset_index().dropna(subset=self.COLUMNS, how="all")
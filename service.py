@@ -0,0 +1,340 @@
+import os
+import json
+import math
+import asyncio
+import argparse
+from http import HTTPStatus
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+import pandas as pd
+from criteria import OPTIMIZATION_CRITERIA, COVARIANCE_ESTIMATORS
+from risk_engine import RISK_METHODS
+from result_cache import ResultCache
+
+## Monte Carlo work allowed per /risk request, in simulated asset-days
+## (scenarios x longest horizon x assets); about a second of one worker
+MAX_SIMULATION_STEPS = 50_000_000
+MIN_SCENARIOS = 1000
+
+## Price source of the worker process; None means each worker opens the default price cache,
+## whose directory is shared safely between processes
+_source = None
+## Frontiers and simulations of the worker, reused by requests over the same data
+_frontierCache = None
+
+
+def initWorker(source):
+    global _source, _frontierCache
+    _source = source
+    _frontierCache = ResultCache(ttl=900, maxBytes=64 * 1024 * 1024)
+
+
+def buildOptimizer(request):
+    from portfolio_optimizer import PortfolioOptimizer
+
+    return PortfolioOptimizer(
+        request["tickers"],
+        request["start"],
+        request["end"],
+        request["criterion"],
+        request["riskFreeRate"],
+        priceSource=_source,
+        covarianceEstimator=request["covariance"],
+        frontierCache=_frontierCache,
+    )
+
+
+def tickerWeights(optimizer, weights):
+    return {ticker.replace(".NS", ""): weight for ticker, weight in zip(optimizer.context.tickers, weights)}
+
+
+def optimize(request):
+    optimizer = buildOptimizer(request)
+    weights = optimizer.optimized_allocation["allocation"].to_numpy()
+    return {"weights": tickerWeights(optimizer, weights), "stats": optimizer.portfolioStats(weights)}
+
+
+def frontier(request):
+    optimizer = buildOptimizer(request)
+    volatility, targetReturns, weights = optimizer.frontierResults(request["points"])
+    return {
+        "points": [
+            {"return": ret, "volatility": std, "weights": tickerWeights(optimizer, w)}
+            for ret, std, w in zip(targetReturns, volatility, weights)
+        ]
+    }
+
+
+def metrics(request):
+    from metrics import MetricsCalculator
+
+    optimizer = buildOptimizer(request)
+    weights = optimizer.optimized_allocation["allocation"].to_numpy()
+    return {"weights": tickerWeights(optimizer, weights), "metrics": MetricsCalculator(optimizer).results.toDict()}
+
+
+def risk(request):
+    from risk import RiskMetrics
+
+    optimizer = buildOptimizer(request)
+    table = RiskMetrics(optimizer).engine.table(
+        request["levels"], request["horizons"], request["methods"], scenarios=request["scenarios"]
+    )
+    return {"risk": table.to_dict("records")}
+
+
+ENDPOINTS = {"/optimize": optimize, "/frontier": frontier, "/metrics": metrics, "/risk": risk}
+
+
+def runEndpoint(path, request):
+    ## Runs in a worker process. Bad input surfaces as ValueError and is reported to the client;
+    ## anything else propagates as a server error.
+    try:
+        return {"result": ENDPOINTS[path](request)}
+    except ValueError as e:
+        return {"error": str(e)}
+
+
+def parseRequest(path, body):
+    ## Checks and fills defaults in the event loop, so malformed requests never take a worker
+    try:
+        request = json.loads(body or b"{}")
+    except ValueError:
+        raise ValueError("Request body is not valid JSON!")
+    if not isinstance(request, dict):
+        raise ValueError("Request body must be a JSON object!")
+
+    tickers = request.get("tickers")
+    if not isinstance(tickers, list) or not all(isinstance(t, str) for t in tickers):
+        raise ValueError("'tickers' must be a list of ticker names!")
+    for field in ("start", "end"):
+        if field not in request:
+            raise ValueError(f"'{field}' is required!")
+        try:
+            request[field] = pd.Timestamp(request[field]).date()
+        except (ValueError, TypeError):
+            raise ValueError(f"'{field}' is not a date!")
+
+    request.setdefault("criterion", "Maximize Sharpe Ratio")
+    request.setdefault("riskFreeRate", 0.07024)
+    request.setdefault("covariance", "Sample")
+    if request["criterion"] not in OPTIMIZATION_CRITERIA:
+        raise ValueError(f"Unknown optimization criterion: {request['criterion']}")
+    if request["covariance"] not in COVARIANCE_ESTIMATORS:
+        raise ValueError(f"Unknown covariance estimator: {request['covariance']}")
+    request["riskFreeRate"] = float(request["riskFreeRate"])
+
+    if path == "/frontier":
+        request["points"] = min(max(int(request.get("points", 100)), 2), 1000)
+    if path == "/risk":
+        for field in ("levels", "horizons", "methods"):
+            if request.get(field) is not None and (not isinstance(request[field], list) or not request[field]):
+                raise ValueError(f"'{field}' must be a non-empty list!")
+        request["levels"] = [float(level) for level in request.get("levels") or (0.9, 0.95, 0.99)]
+        request["horizons"] = [int(horizon) for horizon in request.get("horizons") or (1, 10)]
+        request["methods"] = request.get("methods") or RISK_METHODS
+        request["scenarios"] = max(int(request.get("scenarios", 20000)), MIN_SCENARIOS)
+        if not all(0 < level < 1 for level in request["levels"]):
+            raise ValueError("Confidence levels must lie between 0 and 1!")
+        if not all(horizon >= 1 for horizon in request["horizons"]):
+            raise ValueError("Horizons must be at least one day!")
+        ## Weekdays in the range bound the trading sessions, and a horizon needs at least one
+        ## full window of returns; holidays can still leave a historical row blank
+        sessions = int(np.busday_count(request["start"], request["end"]))
+        if max(request["horizons"]) >= sessions:
+            raise ValueError(f"Horizons must be shorter than the {sessions} sessions between start and end!")
+        unknown = [method for method in request["methods"] if method not in RISK_METHODS]
+        if unknown:
+            raise ValueError(f"Unknown risk method: {unknown[0]}")
+        ## The simulation cost grows with the path length and the number of assets, not just the
+        ## scenario count, so the scenarios are trimmed to fit the budget
+        stepsPerScenario = max(request["horizons"]) * max(len(tickers), 1)
+        if MIN_SCENARIOS * stepsPerScenario > MAX_SIMULATION_STEPS:
+            raise ValueError("Horizons are too long for this many tickers!")
+        request["scenarios"] = min(request["scenarios"], MAX_SIMULATION_STEPS // stepsPerScenario)
+    return request
+
+
+def jsonable(value):
+    ## numpy scalars and arrays become plain JSON types, and NaN or infinity becomes null
+    if isinstance(value, dict):
+        return {str(k): jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [jsonable(v) for v in value]
+    if isinstance(value, (np.integer, np.bool_)):
+        return value.item()
+    if isinstance(value, (float, np.floating)):
+        return float(value) if math.isfinite(value) else None
+    return value
+
+
+class OptimizationService:
+    ## Asynchronous HTTP/JSON front end over a process pool. At most `workers` requests run
+    ## and `queueSize` more wait; beyond that new requests are turned away with 503 instead of
+    ## piling up. A request that is not answered within `timeout` seconds gets 504. If it is
+    ## still queued it is cancelled, and if it is already running it keeps its slot until the
+    ## worker is free, so the admission count always matches the work in the pool.
+
+    def __init__(self, workers=None, queueSize=None, timeout=60.0, priceSource=None, maxBody=1024 * 1024):
+        self.workers = workers or os.cpu_count()
+        self.queueSize = 2 * self.workers if queueSize is None else queueSize
+        self.timeout = timeout
+        self.priceSource = priceSource
+        self.maxBody = maxBody
+        self.pending = 0
+        self.served = {}
+        self.executor = None
+
+    @property
+    def capacity(self):
+        return self.workers + self.queueSize
+
+    def startPool(self):
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers, initializer=initWorker, initargs=(self.priceSource,)
+        )
+
+    def release(self, future):
+        self.pending -= 1
+
+    async def dispatch(self, path, request):
+        if self.pending >= self.capacity:
+            return HTTPStatus.SERVICE_UNAVAILABLE, {"error": "Server busy, retry later"}
+
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        try:
+            future = self.executor.submit(runEndpoint, path, request)
+        except BrokenProcessPool:
+            self.pending -= 1
+            self.startPool()
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "Worker pool restarted, retry the request"}
+        ## The slot is freed when the worker finishes, not when the client stops waiting
+        future.add_done_callback(lambda f: loop.call_soon_threadsafe(self.release, f))
+
+        try:
+            outcome = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            future.cancel()
+            return HTTPStatus.GATEWAY_TIMEOUT, {"error": f"No result within {self.timeout:g}s"}
+        except BrokenProcessPool:
+            self.startPool()
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "Worker process died"}
+        except Exception as e:
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"{type(e).__name__}: {e}"}
+
+        if "error" in outcome:
+            return HTTPStatus.UNPROCESSABLE_ENTITY, outcome
+        return HTTPStatus.OK, outcome["result"]
+
+    async def route(self, method, path, body):
+        if path == "/health":
+            return HTTPStatus.OK, {
+                "status": "ok",
+                "workers": self.workers,
+                "pending": self.pending,
+                "capacity": self.capacity,
+                "served": self.served,
+            }
+        if path not in ENDPOINTS:
+            return HTTPStatus.NOT_FOUND, {"error": f"Unknown endpoint: {path}"}
+        if method != "POST":
+            return HTTPStatus.METHOD_NOT_ALLOWED, {"error": "Use POST with a JSON body"}
+        try:
+            request = parseRequest(path, body)
+        except (ValueError, TypeError) as e:
+            return HTTPStatus.BAD_REQUEST, {"error": str(e)}
+        status, payload = await self.dispatch(path, request)
+        key = f"{path} {status.value}"
+        self.served[key] = self.served.get(key, 0) + 1
+        return status, payload
+
+    async def handleConnection(self, reader, writer):
+        ## One request per connection; enough for tools that call it a few times a second
+        try:
+            status, payload = await self.readAndRoute(reader)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+
+        body = json.dumps(jsonable(payload)).encode()
+        headers = [
+            f"HTTP/1.1 {status.value} {status.phrase}",
+            "Content-Type: application/json",
+            f"Content-Length: {len(body)}",
+            "Connection: close",
+        ]
+        if status == HTTPStatus.SERVICE_UNAVAILABLE:
+            headers.append("Retry-After: 1")
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode() + body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def readAndRoute(self, reader):
+        requestLine = (await reader.readline()).decode("latin-1").split()
+        if len(requestLine) != 3:
+            return HTTPStatus.BAD_REQUEST, {"error": "Malformed request line"}
+        method, target, _ = requestLine
+
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length", 0) or 0)
+        if length > self.maxBody:
+            return HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "Request body too large"}
+        body = await reader.readexactly(length) if length else b""
+        return await self.route(method.upper(), target.split("?")[0].rstrip("/") or "/", body)
+
+    async def serve(self, host="127.0.0.1", port=8000):
+        self.startPool()
+        server = await asyncio.start_server(self.handleConnection, host, port)
+        print(f"Serving {', '.join(ENDPOINTS)} on http://{host}:{port} with {self.workers} workers")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP/JSON service for optimization, frontier, metrics and risk")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--queue", type=int, default=None, help="requests allowed to wait (default: 2 x workers)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds before a request gets 504")
+    parser.add_argument("--universe", help="memory-mapped universe panel directory (see universe_panel.py)")
+    parser.add_argument("--synthetic", action="store_true", help="serve deterministic synthetic prices, no network")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic prices")
+    args = parser.parse_args()
+
+    priceSource = None
+    if args.synthetic:
+        from synthetic import SyntheticPriceSource
+
+        priceSource = SyntheticPriceSource(seed=args.seed)
+    elif args.universe:
+        from price_cache import defaultPriceCache
+        from universe_panel import UniversePanel
+
+        priceSource = UniversePanel(args.universe, fallback=defaultPriceCache())
+
+    service = OptimizationService(args.workers, args.queue, args.timeout, priceSource)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
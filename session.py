@@ -0,0 +1,196 @@
+import threading
+import contextvars
+import numpy as np
+from portfolio_optimizer import PortfolioOptimizer
+from metrics import MetricsCalculator
+from risk import RiskMetrics
+from backtest import Backtester
+from lazy import lazyProperty
+
+
+class AnalysisSession:
+    ## One dashboard request. Every stage is computed on first access and then reused,
+    ## so the optimizer, frontier and simulations run once no matter how many tabs need them.
+
+    ## Attributes each tab needs, grouped so a tab can be shown as soon as its group is done
+    STAGES = {
+        "frontier": ("frontier", "frontierStats"),
+        "metrics": ("metricTable",),
+        "returns": ("rollingTable",),
+        "risk": ("riskTable",),
+        ## Apart from "risk", so a range too short for the methods table keeps the VaR table
+        "riskMethods": ("riskEngineTable",),
+        "cvarFrontier": ("cvarFrontier",),
+        "comparison": ("comparison",),
+        "backtest": ("backtest",),
+    }
+
+    def __init__(
+        self, stocks, start, end, optimization_criterion, riskFreeRate=0.07024, priceSource=None,
+        covarianceEstimator="Sample", frontierCache=None, processPool=None):
+        self.stocks = stocks
+        self.start = start
+        self.end = end
+        self.optimization_criterion = optimization_criterion
+        self.riskFreeRate = riskFreeRate
+        self.priceSource = priceSource
+        self.covarianceEstimator = covarianceEstimator
+        ## Shared by sessions over the same data, see PortfolioOptimizer.shared
+        self.frontierCache = frontierCache
+        ## (executor, workers) shared by every session's backtest and objective comparison;
+        ## None solves the comparison in this process and starts a pool per backtest
+        self.processPool = processPool
+        self.futures = {}
+        self.lock = threading.Lock()
+
+    def cacheKey(self):
+        return (
+            tuple(self.stocks),
+            self.start,
+            self.end,
+            self.optimization_criterion,
+            round(self.riskFreeRate, 8),
+            self.covarianceEstimator,
+        )
+
+    @staticmethod
+    def stageNames(compare=False, backtest=False):
+        names = ["frontier", "metrics", "returns", "risk", "riskMethods", "cvarFrontier"]
+        if compare:
+            names.append("comparison")
+        if backtest:
+            names.append("backtest")
+        return names
+
+    def summary(self):
+        ## What the Summary tab shows: the optimal weights and the headline metrics
+        self.optimizer
+        self.metrics.results
+        return self
+
+    def stage(self, name):
+        for attribute in self.STAGES[name]:
+            getattr(self, attribute)
+        return self
+
+    def compute(self, compare=False, backtest=False):
+        ## Runs every stage the dashboard shows, so a cached session renders without recomputing
+        self.summary()
+        for name in self.stageNames(compare, backtest):
+            self.stage(name)
+        return self
+
+    def startStages(self, executor, names, onDone=None):
+        ## Submits each stage to `executor` once. Reruns and other users of a cached session get
+        ## the futures already running. Stages run in a copy of the caller's context, so the
+        ## active instrumentation still records them. `onDone` runs when the last one finishes.
+        with self.lock:
+            for name in names:
+                if name not in self.futures:
+                    self.futures[name] = executor.submit(contextvars.copy_context().run, self.stage, name)
+            futures = {name: self.futures[name] for name in names}
+
+        if onDone is not None:
+            remaining = [len(futures)]
+
+            def finished(future):
+                with self.lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last:
+                    onDone()
+
+            for future in futures.values():
+                future.add_done_callback(finished)
+        return futures
+
+    def nbytes(self):
+        ## Rough in-memory size of the computed stages, used for cache eviction
+        optimizer = self.__dict__.get("optimizer")
+        if optimizer is None:
+            return 0
+        context = optimizer.context
+        ## Returns are held both as arrays and as the date-indexed frames built on them
+        total = 2 * (context.assetReturns.nbytes + context.benchmarkReturns.nbytes)
+        total += optimizer.covMatrix.to_numpy().nbytes
+        ## Stages shared through the frontier cache are counted there
+        if self.frontierCache is None:
+            for stage in ("simulationResults", "frontier"):
+                for value in optimizer.__dict__.get(stage, ()):
+                    total += np.asarray(value).nbytes
+        rolling = self.__dict__.get("rollingTable")
+        if rolling is not None:
+            total += int(rolling.memory_usage(index=False).sum())
+        return total
+
+    @lazyProperty
+    def optimizer(self):
+        return PortfolioOptimizer(
+            self.stocks,
+            self.start,
+            self.end,
+            self.optimization_criterion,
+            self.riskFreeRate,
+            priceSource=self.priceSource,
+            covarianceEstimator=self.covarianceEstimator,
+            frontierCache=self.frontierCache,
+        )
+
+    @lazyProperty
+    def metrics(self):
+        return MetricsCalculator(self.optimizer)
+
+    @lazyProperty
+    def risk(self):
+        return RiskMetrics(self.optimizer)
+
+    @lazyProperty
+    def metricTable(self):
+        return self.metrics.metricDf()
+
+    @lazyProperty
+    def rollingTable(self):
+        return self.metrics.rolling.long()
+
+    @lazyProperty
+    def riskTable(self):
+        return self.risk.riskTable()
+
+    @lazyProperty
+    def riskEngineTable(self):
+        return self.risk.riskEngineTable()
+
+    @lazyProperty
+    def cvarFrontier(self):
+        return self.optimizer.cvarFrontier(frontierPoints=20)
+
+    @lazyProperty
+    def frontier(self):
+        ## Traces the frontier and draws the simulated cloud the Efficient Frontier tab plots
+        return self.optimizer.frontier
+
+    @lazyProperty
+    def frontierStats(self):
+        return self.optimizer.frontierStats()
+
+    @lazyProperty
+    def comparison(self):
+        executor = None if self.processPool is None else self.processPool[0]
+        return self.optimizer.compareCriteria(executor=executor)
+
+    @lazyProperty
+    def backtest(self):
+        backtester = Backtester(
+            self.stocks,
+            self.start,
+            self.end,
+            self.optimization_criterion,
+            self.riskFreeRate,
+            priceSource=self.priceSource,
+            covarianceEstimator=self.covarianceEstimator,
+        )
+        if self.processPool is None:
+            return backtester.run()
+        executor, workers = self.processPool
+        return backtester.run(workers, executor)
+
@@ -0,0 +1,65 @@
+import numpy as np
+from covariance import DenseCovariance
+
+
+class PortfolioSimulator:
+    ## Random long-only portfolios drawn uniformly from the simplex (Dirichlet(1, ..., 1)),
+    ## evaluated in chunks sized to a memory budget so millions of draws stay cheap. The
+    ## covariance is a matrix or a covariance model (see covariance.py).
+
+    def __init__(self, meanReturns, covMatrix, seed=None, memoryBudget=64 * 1024 * 1024):
+        self.meanReturns = np.asarray(meanReturns, dtype=np.float64)
+        self.covModel = covMatrix if hasattr(covMatrix, "variances") else DenseCovariance(covMatrix)
+        self.seed = seed
+        self.memoryBudget = memoryBudget
+
+    def chunkSize(self):
+        ## The weight block and its product with the covariance are the two live arrays
+        numAssets = len(self.meanReturns)
+        return max(1, self.memoryBudget // (2 * 8 * numAssets))
+
+    def weights(self, rng, noOfPortfolios):
+        weight = rng.standard_exponential((noOfPortfolios, len(self.meanReturns)))
+        weight /= weight.sum(axis=1, keepdims=True)
+        return weight
+
+    def run(self, noOfPortfolios=10000, keepWeights=False):
+        rng = np.random.default_rng(self.seed)
+        expectedReturn = np.empty(noOfPortfolios)
+        expectedVolatility = np.empty(noOfPortfolios)
+        weights = np.empty((noOfPortfolios, len(self.meanReturns))) if keepWeights else None
+
+        chunk = self.chunkSize()
+        for lo in range(0, noOfPortfolios, chunk):
+            hi = min(noOfPortfolios, lo + chunk)
+            weight = self.weights(rng, hi - lo)
+            expectedReturn[lo:hi] = weight @ self.meanReturns * 252
+            variance = self.covModel.variances(weight)
+            expectedVolatility[lo:hi] = np.sqrt(variance * 252)
+            if keepWeights:
+                weights[lo:hi] = weight
+
+        return expectedVolatility, expectedReturn, weights
+
+
+def decimate(x, y, maxPoints=4000, bins=200, seed=0):
+    ## Indices of at most `maxPoints` points that draw the same picture as the full cloud:
+    ## the upper and lower envelope per volatility bin keep the cloud's outline, and a
+    ## uniform sample of the rest keeps its density, so plotting cost no longer grows
+    ## with the number of simulations.
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if len(x) <= maxPoints:
+        return np.arange(len(x))
+
+    edges = np.linspace(x.min(), x.max(), bins + 1)[1:-1]
+    column = np.searchsorted(edges, x)
+    order = np.lexsort((y, column))
+    _, first = np.unique(column[order], return_index=True)
+    last = np.append(first[1:], len(order)) - 1
+    envelope = np.unique(np.concatenate([order[first], order[last]]))
+
+    rng = np.random.default_rng(seed)
+    remaining = max(0, maxPoints - len(envelope))
+    sample = rng.choice(len(x), size=remaining, replace=False)
+    return np.union1d(envelope, sample)
@@ -0,0 +1,40 @@
+import zlib
+import numpy as np
+import pandas as pd
+
+
+class SyntheticPriceSource:
+    ## Offline stand-in for Yahoo. Daily returns follow a k-factor model: every ticker loads
+    ## on shared market/sector factors plus its own noise, and ^NSEI tracks the market
+    ## factor. All draws are keyed on the seed, the ticker name and a fixed business-day
+    ## calendar, so overlapping requests always see identical prices.
+
+    def __init__(self, seed=0, numFactors=3, calendarStart="2000-01-01", calendarEnd="2040-01-01"):
+        self.seed = seed
+        self.numFactors = numFactors
+        self.calendar = pd.bdate_range(calendarStart, calendarEnd, inclusive="left")
+        rng = np.random.default_rng([seed, 0])
+        factorVols = np.array([0.010] + [0.006] * (numFactors - 1))
+        self.factorReturns = rng.normal(0.0, 1.0, (len(self.calendar), numFactors)) * factorVols
+        self.factorReturns[:, 0] += 0.0004
+
+    def tickerReturns(self, ticker):
+        rng = np.random.default_rng([self.seed, zlib.crc32(ticker.encode())])
+        if ticker.startswith("^"):
+            loadings = np.zeros(self.numFactors)
+            loadings[0] = 1.0
+            drift, noise = 0.0, 0.002
+        else:
+            loadings = np.concatenate([rng.uniform(0.5, 1.5, 1), rng.normal(0.0, 0.7, self.numFactors - 1)])
+            drift, noise = rng.normal(0.0002, 0.0003), rng.uniform(0.008, 0.02)
+        return self.factorReturns @ loadings + drift + rng.normal(0.0, noise, len(self.calendar))
+
+    def getPrices(self, tickers, start, end):
+        rows = (self.calendar >= pd.Timestamp(start)) & (self.calendar < pd.Timestamp(end))
+        prices = {}
+        for ticker in tickers:
+            returns = self.tickerReturns(ticker)
+            prices[ticker] = (100 * np.cumprod(1 + returns))[rows]
+        frame = pd.DataFrame(prices, index=self.calendar[rows])
+        frame.index.name = "Date"
+        return frame
@@ -0,0 +1,164 @@
+import os
+import json
+import argparse
+import datetime as dt
+import numpy as np
+import pandas as pd
+from price_cache import defaultPriceCache
+from instrumentation import span, count
+
+
+class UniversePanel:
+    ## Close prices for a whole exchange universe in one raw float64 file (dates x tickers,
+    ## column-major so each ticker's history is contiguous), opened as a read-only memory map.
+    ## Every process that opens the same directory shares the page cache's single copy, and
+    ## getPrices only touches the pages of the tickers and dates it returns. Pickling keeps
+    ## just the directory, so worker processes reopen the map instead of receiving a copy.
+
+    def __init__(self, directory=None, fallback=None):
+        self.directory = directory or os.environ.get(
+            "UNIVERSE_PANEL_DIR", os.path.join(".cache", "universe")
+        )
+        self.fallback = fallback
+        self.open()
+
+    def open(self):
+        with open(os.path.join(self.directory, "meta.json")) as f:
+            meta = json.load(f)
+        self.tickers = meta["tickers"]
+        self.columns = {ticker: i for i, ticker in enumerate(self.tickers)}
+        self.dates = pd.DatetimeIndex(np.load(os.path.join(self.directory, meta["dates"])))
+        self.prices = np.memmap(
+            os.path.join(self.directory, meta["prices"]),
+            dtype=np.float64,
+            mode="r",
+            shape=(len(self.dates), len(self.tickers)),
+            order="F",
+        )
+
+    def __getstate__(self):
+        return {"directory": self.directory, "fallback": self.fallback}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.open()
+
+    def columnViews(self, tickers, start, end):
+        ## Zero-copy views of each ticker's prices over [start, end)
+        lo, hi = self.dates.searchsorted([pd.Timestamp(start), pd.Timestamp(end)])
+        return self.dates[lo:hi], {t: self.prices[lo:hi, self.columns[t]] for t in tickers if t in self.columns}
+
+    def getPrices(self, tickers, start, end):
+        dates, views = self.columnViews(tickers, start, end)
+        count("universe.hit", len(views))
+        prices = pd.DataFrame(views, index=dates, columns=list(views)).dropna(how="all")
+        prices.index.name = "Date"
+
+        missing = [ticker for ticker in tickers if ticker not in views]
+        if missing and self.fallback is not None:
+            count("universe.miss", len(missing))
+            prices = prices.join(self.fallback.getPrices(missing, start, end), how="outer")
+        return prices
+
+
+def writePanel(directory, prices):
+    ## Writes a complete panel next to the current one and swaps it in with a rename, so open
+    ## readers keep their (old) mapping and new readers see the whole update or none of it
+    prices = prices.sort_index()
+    version = dt.datetime.now().strftime("%Y%m%d%H%M%S%f")
+    names = {"prices": f"prices-{version}.f64", "dates": f"dates-{version}.npy"}
+    os.makedirs(directory, exist_ok=True)
+
+    np.save(os.path.join(directory, names["dates"]), prices.index.to_numpy(dtype="datetime64[ns]"))
+    target = np.memmap(
+        os.path.join(directory, names["prices"]), dtype=np.float64, mode="w+", shape=prices.shape, order="F"
+    )
+    for i, ticker in enumerate(prices.columns):
+        target[:, i] = prices[ticker].to_numpy(dtype=np.float64)
+    target.flush()
+    del target
+
+    meta = {"tickers": list(prices.columns), "built": dt.datetime.now().isoformat(timespec="seconds"), **names}
+    tmp = os.path.join(directory, "meta.json.tmp")
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(directory, "meta.json"))
+
+    ## Earlier versions are unlinked; processes still mapping them keep their pages
+    for name in os.listdir(directory):
+        if name.startswith(("prices-", "dates-")) and name not in names.values():
+            os.remove(os.path.join(directory, name))
+
+
+def buildPanel(directory, tickers, start, end, priceSource=None):
+    priceSource = priceSource if priceSource is not None else defaultPriceCache()
+    with span("universe.build", tickers=len(tickers)):
+        prices = priceSource.getPrices(list(tickers), start, end)
+        writePanel(directory, prices.reindex(columns=list(tickers)))
+    return UniversePanel(directory)
+
+
+def updatePanel(directory, end=None, tickers=(), priceSource=None):
+    ## Appends sessions up to `end` for the current tickers and full history for new ones
+    priceSource = priceSource if priceSource is not None else defaultPriceCache()
+    panel = UniversePanel(directory)
+    end = pd.Timestamp(end or dt.date.today() + dt.timedelta(days=1))
+    current = pd.DataFrame(np.asarray(panel.prices), index=panel.dates, columns=panel.tickers)
+
+    with span("universe.update"):
+        ## The last stored session is refetched in case it was captured before the close
+        frames = [current.iloc[:-1]]
+        frames.append(priceSource.getPrices(panel.tickers, panel.dates[-1], end))
+        prices = pd.concat(frames)
+        prices = prices[~prices.index.duplicated(keep="last")]
+
+        added = [ticker for ticker in tickers if ticker not in panel.columns]
+        if added:
+            history = priceSource.getPrices(added, panel.dates[0], end)
+            prices = prices.join(history, how="outer")
+        writePanel(directory, prices)
+    return UniversePanel(directory)
+
+
+def readTickers(path, suffix):
+    with open(path) as f:
+        names = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    return [name if "." in name or name.startswith("^") else name + suffix for name in names]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or update the memory-mapped universe price panel")
+    parser.add_argument("command", choices=["build", "update", "info"])
+    parser.add_argument("--dir", default=None, help="panel directory (default: $UNIVERSE_PANEL_DIR or .cache/universe)")
+    parser.add_argument("--tickers", help="file with one ticker per line")
+    parser.add_argument("--suffix", default=".NS", help="appended to tickers without an exchange suffix")
+    parser.add_argument("--benchmark", default="^NSEI")
+    parser.add_argument("--start", default=(dt.date.today() - dt.timedelta(days=5 * 365)).isoformat())
+    parser.add_argument("--end", default=None)
+    args = parser.parse_args()
+
+    directory = args.dir or os.environ.get("UNIVERSE_PANEL_DIR", os.path.join(".cache", "universe"))
+    tickers = readTickers(args.tickers, args.suffix) if args.tickers else []
+    if args.benchmark and args.benchmark not in tickers:
+        tickers.append(args.benchmark)
+
+    if args.command == "build":
+        if os.path.exists(os.path.join(directory, "meta.json")):
+            print(f"Replacing the panel in {directory}")
+        end = args.end or (dt.date.today() + dt.timedelta(days=1)).isoformat()
+        panel = buildPanel(directory, tickers, args.start, end)
+    elif args.command == "update":
+        panel = updatePanel(directory, args.end, tickers)
+    else:
+        panel = UniversePanel(directory)
+
+    available = int(np.isfinite(np.asarray(panel.prices)).any(axis=0).sum())
+    print(
+        f"{len(panel.tickers)} tickers ({available} with data), {len(panel.dates)} sessions "
+        f"from {panel.dates[0].date()} to {panel.dates[-1].date()}, "
+        f"{panel.prices.nbytes / 1024**2:.1f} MB in {directory}"
+    )
+
+
+if __name__ == "__main__":
+    main()